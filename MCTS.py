@@ -2,22 +2,330 @@ import random
 import math
 import time
 import copy
+import os
+import threading
+import collections
+import concurrent.futures
+
+def make_pool(num_workers=None):
+    '''Creates a process pool for root-parallel MCTS (see the pool argument of MCTS), and starts
+    its worker processes. The pool is intended to be created once and reused for every move, so
+    that process startup is only paid once.
+    
+    Arguments:
+        num_workers:
+            int - number of worker processes. Defaults to the number of cores. It is kept as the
+            pool's num_workers attribute (see pool_workers).
+    '''
+    num_workers = num_workers or os.cpu_count()
+    pool = concurrent.futures.ProcessPoolExecutor(num_workers)
+    pool.num_workers = num_workers
+    for future in [pool.submit(os.getpid) for _ in range(num_workers)]:
+        future.result()
+    return pool
+
+def pool_workers(pool):
+    '''Returns the number of worker processes in pool, as recorded by make_pool, or the number of
+    cores for pools made some other way (or None).
+    '''
+    return getattr(pool, 'num_workers', None) or os.cpu_count()
+
+def _root_parallel_search(search_class, game, settings, seed):
+    '''Runs one independent search in a worker process for root-parallel MCTS. settings holds the
+    keyword arguments for search_class, including the worker's share of the budgets.
+    
+    Returns tuple of the number of simulations run, and a list of (action, num_sims, reward_sum)
+    for each child of the root.
+    '''
+    import numpy as np
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+    search = search_class(game, None, **settings)
+    for _ in search.anytime():
+        pass
+    return search.total_sims, search.root_child_stats()
+
+class MCTS_Stats():
+    '''Timers and counters for the steps of MCTS, collected by a search created with
+    collect_stats=True (see MCTS). While collecting, the methods listed by the search's
+    'instrumented_methods' are replaced by timed versions, set as instance attributes by 'attach'
+    and removed again by 'detach', so a search that does not collect stats runs no extra code.
+
+    Only searches run in this process by 'MCTS.anytime' are instrumented, not the tree-parallel or
+    root-parallel searches.
+
+    Attributes:
+        phase_seconds:
+            dict mapping each of PHASES to the total seconds spent in it. Time spent in a step
+            called by another is counted only for the inner step, e.g. 'select' does not include
+            the time of the 'play' and 'expand' steps during a descent.
+        phase_calls:
+            dict mapping each of PHASES to the number of calls of its method.
+        iterations:
+            int - number of iterations run.
+        seconds:
+            float - wall time of the search.
+        depth_histogram:
+            collections.Counter mapping depth of the leaf reached (in generations below the root)
+            to number of descents.
+        rollout_lengths:
+            collections.Counter mapping number of moves played in a rollout to number of
+            rollouts. Rollouts done with batch_rollout are not included.
+        nodes_allocated:
+            int - number of nodes added to the tree.
+    '''
+    PHASES = ('select', 'play', 'expand', 'rollout', 'evaluate', 'back_prop')
+
+    def __init__(self):
+        self.phase_seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.phase_calls = dict.fromkeys(self.PHASES, 0)
+        self.iterations = 0
+        self.seconds = 0.0
+        self.depth_histogram = collections.Counter()
+        self.rollout_lengths = collections.Counter()
+        self.nodes_allocated = 0
+        self._inner_seconds = 0.0
+        self._paused = False
+        self._wrapped = []
+        self._start_time = None
+
+    def timed(self, method, phase, count=True, before=None, after=None, nested=True):
+        '''Returns a version of method that adds its time to phase_seconds[phase], minus the time
+        of any timed methods it calls, and (if count) adds 1 to phase_calls[phase]. before is
+        called with the method's arguments before it runs, and after with the result of before
+        and the method's return value. If nested is False, timed methods called by method are
+        not timed separately (e.g. the moves played during a rollout count as rollout time).
+        '''
+        def timed_method(*args, **kwargs):
+            if self._paused:
+                return method(*args, **kwargs)
+            self._paused = not nested
+            outer_inner_seconds = self._inner_seconds
+            self._inner_seconds = 0.0
+            state = before(*args) if before is not None else None
+            start_time = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start_time
+                self._paused = False
+                self.phase_seconds[phase] += elapsed - self._inner_seconds
+                self._inner_seconds = outer_inner_seconds + elapsed
+            if count:
+                self.phase_calls[phase] += 1
+            if after is not None:
+                after(state, result)
+            return result
+        return timed_method
+
+    def attach(self, search):
+        '''Starts collecting stats for search, by wrapping the methods it lists in
+        'instrumented_methods'.
+        '''
+        def record_depth(_, path):
+            self.depth_histogram[len(path) - 1] += 1
+        def record_rollout(start_plays, _):
+            self.rollout_lengths[search.sim_game.num_plays - start_plays] += 1
+        hooks = {
+            'descend': {'count': False, 'after': record_depth},
+            'rollout': {'before': lambda *_: search.sim_game.num_plays, 'after': record_rollout,
+                        'nested': False},
+            'batch_rollout': {'nested': False},
+            'expand': {'before': lambda *_: search.node_count(),
+                       'after': lambda start_nodes, _: self._add_nodes(search, start_nodes)},
+            'expand_child': {'before': lambda *_: search.node_count(),
+                             'after': lambda start_nodes, _: self._add_nodes(search, start_nodes)},
+            'add_virtual_loss': {'count': False},
+        }
+        self._start_time = time.perf_counter()
+        for phase, obj, name in search.instrumented_methods():
+            if not hasattr(obj, name):
+                continue
+            setattr(obj, name, self.timed(getattr(obj, name), phase, **hooks.get(name, {})))
+            self._wrapped.append((obj, name))
+
+    def _add_nodes(self, search, start_nodes):
+        self.nodes_allocated += search.node_count() - start_nodes
+
+    def detach(self, search):
+        '''Stops collecting stats, restoring the methods wrapped by 'attach'.'''
+        for obj, name in self._wrapped:
+            delattr(obj, name)
+        self._wrapped = []
+        self.update(search)
+
+    def update(self, search):
+        '''Brings iterations and seconds up to date with search.'''
+        self.iterations = search.iterations
+        self.seconds = time.perf_counter() - self._start_time
+
+    def summary(self):
+        '''Returns a dict of the stats, with the fraction of the time spent in each phase and the
+        mean rollout length and leaf depth, for printing or saving as JSON.
+        '''
+        phase_total = sum(self.phase_seconds.values())
+        def mean(counter):
+            total = sum(counter.values())
+            return sum(value * count for value, count in counter.items()) / total if total else None
+        return {
+            'iterations': self.iterations,
+            'seconds': self.seconds,
+            'iterations_per_second': self.iterations / self.seconds if self.seconds else None,
+            'phase_seconds': dict(self.phase_seconds),
+            'phase_fraction': {phase: seconds / phase_total if phase_total else 0
+                               for phase, seconds in self.phase_seconds.items()},
+            'phase_calls': dict(self.phase_calls),
+            'nodes_allocated': self.nodes_allocated,
+            'mean_leaf_depth': mean(self.depth_histogram),
+            'depth_histogram': dict(sorted(self.depth_histogram.items())),
+            'mean_rollout_length': mean(self.rollout_lengths),
+            'rollout_lengths': dict(sorted(self.rollout_lengths.items())),
+        }
 
 class MCTS():
-    def __init__(self, game, time):
+    def __init__(self, game, time, batch_size=1, pool=None, num_searches=None, num_threads=1,
+                 exploration=2, transpositions=False, table_size=1000000, max_iterations=None,
+                 max_nodes=None, deadline=None, early_stop=False, collect_stats=False,
+                 stats_callback=None, stats_every=1000, rollout_policy=None, evaluator=None,
+                 value_weight=1.0, c_puct=1.5, book=None, solver=False, endgame_solver=None,
+                 max_depth=9, lazy_expansion=False, widening=None):
         '''For selecting a single move using Monte-Carlo Tree Search.
         
         Arguments:
             game:
-                object - instance of a class for a game e.g. Connect_Four.
-                Must have methods rollout, actions_available, set_print_game,
-                play, print_board, get_reward and the attribute player_turn.
+                game.Game - the game to search, e.g. Connect_Four_Bitboard or
+                connect_n.Connect_N. Any object with the methods and
+                attributes described in game.Game will do.
             time:
-                float - seconds allowed to decide on a move.
+                float - seconds allowed to decide on a move, or None for no
+                time limit. The search stops as soon as any one of time,
+                max_iterations, max_nodes and deadline is reached, and at
+                least one of them must be given.
+            batch_size:
+                int - number of leaves to gather per iteration. If more than
+                1, each iteration selects this many leaves (using virtual
+                loss to spread them over the tree) and rolls them all out
+                with a single call to the game's batch_rollout method.
+            pool:
+                concurrent.futures.ProcessPoolExecutor (see make_pool) - if
+                given, run_MCTS runs num_searches independent searches in the
+                pool for the same time, then merges the statistics of each of
+                their root children before choosing a move (root-parallel
+                MCTS). The pool can be shared across moves.
+            num_searches:
+                int - number of independent searches to run in pool.
+                Defaults to the pool's number of workers (see
+                pool_workers), so that they all run at once.
+            num_threads:
+                int - if more than 1, run_MCTS runs this many worker threads
+                that all descend the same tree (tree-parallel MCTS), using
+                virtual loss to spread the threads over different branches.
+            exploration:
+                float - exploration constant c in the upper confidence bound
+                avg_reward + sqrt(c * ln(total_sims) / num_sims). Higher
+                values explore less visited nodes more.
+            transpositions:
+                boolean - if True, positions reached by different orders of
+                moves share a single node (so the tree becomes a directed
+                acyclic graph), found through a transposition table keyed by
+                game.get_hash(). The game must then also have the methods
+                get_hash and hash_after.
+            table_size:
+                int - maximum number of positions in the transposition
+                table. The least recently used position is evicted when it
+                is full; its node stays in the tree but is no longer shared.
+            max_iterations:
+                int - maximum number of iterations (i.e. simulations) per
+                search, or None. With no time limit, a search with a fixed
+                random seed is reproducible.
+            max_nodes:
+                int - stop searching once the tree has this many nodes, or
+                None.
+            deadline:
+                float - time.time() value by which every search must have
+                finished, or None.
+            early_stop:
+                boolean - if True, stop searching once the move to be chosen
+                is so far ahead that no other move's average reward could
+                overtake it in the iterations remaining (estimated from the
+                search rate when limited by time), see 'decided'.
+            collect_stats:
+                boolean - if True, each search records timings and counters
+                for its steps in an MCTS_Stats object, stored in the stats
+                attribute. Stats are only collected for searches run in this
+                process (i.e. not with pool or num_threads > 1). Timing adds
+                some overhead, so searches that do not collect stats run none
+                of the instrumentation.
+            stats_callback:
+                function - called as stats_callback(stats) every stats_every
+                iterations while stats are collected. Implies collect_stats.
+            stats_every:
+                int - number of iterations between calls to stats_callback.
+            rollout_policy:
+                object with methods rollout(game), returning the rewards for
+                players (0, 1), and batch_rollout(game, snapshots), e.g. one
+                of those in rollout_policies. Used to play out (or evaluate)
+                the position at each leaf. If None, the game's own rollout
+                and batch_rollout are used, i.e. random moves.
+            evaluator:
+                evaluator.Batch_Evaluator - if given, the position at every
+                leaf is evaluated by a network, in batches: iterations are
+                run batch_size at a time as with batch_size > 1, and the
+                leaves of all searches and threads sharing the evaluator are
+                batched together. The network's priors for a leaf's actions
+                guide selection (see 'puct_index'), and its value replaces
+                or is mixed with a rollout (see value_weight). Not supported
+                for root-parallel MCTS.
+            value_weight:
+                float - weight of the network's value in the result of an
+                iteration, with the rest given to a rollout. With 1 (the
+                default) no rollouts are done.
+            c_puct:
+                float - exploration constant for selection with an evaluator:
+                Q + c_puct * prior * sqrt(parent sims) / (1 + sims).
+            book:
+                opening_book.Opening_Book - if given, run_MCTS looks up the
+                position (by game.get_hash()) before searching. With at least
+                book.min_sims simulations in the book, its move is returned
+                without searching; otherwise a new tree starts from the
+                book's statistics for the root's children. The results of
+                every search are stored back in the book.
+            solver:
+                boolean - if True, nodes whose position is decided are marked
+                with their exact value (MCTS-Solver): leaves where the game
+                is over or that endgame_solver solves, and then any node with
+                a child that wins for the player choosing it, or whose
+                children are all decided. Decided nodes get their exact value
+                instead of rollouts, children that lose are never selected,
+                and the search stops once the root is decided.
+            endgame_solver:
+                function - called as endgame_solver(game) on leaves when
+                solver is True, returns the value of the position for the
+                player to move (1 win, 0 draw, -1 loss) with perfect play, or
+                None if it is not solved, e.g. solver.Endgame_Solver.
+            max_depth:
+                int - max number of generations in the tree, counted from the
+                current root, or None for no limit.
+            lazy_expansion:
+                boolean - if True, a node's children are created one at a
+                time, each the first time it is selected, rather than all at
+                once when the node is first expanded (see 'expand_child').
+                Selects moves the way eager expansion does, since unvisited
+                children are tried first in random order either way, but
+                allocates only the children that are visited. The root's
+                children are still all created up front. Not supported with
+                an evaluator.
+            widening:
+                tuple of (constant, exponent) - progressive widening for
+                large action spaces: a node with num_sims simulations may
+                have at most ceil(constant * num_sims ** exponent) children,
+                so the search goes deeper among the children tried so far
+                rather than trying every action once. Implies
+                lazy_expansion.
         
         Attributes:
             seconds_allowed:
-                float - seconds allowed to decide on a move.
+                float - seconds allowed to decide on a move, or None.
             root:
                 Node - First node in the tree, and not associated with an
                 action. This nodes direct children will be for the actions
@@ -25,107 +333,744 @@ class MCTS():
                 one of them will be selected).
             total_sims:
                 int - for tracking total number of games simulated.
-            max_depth:
-                int - max number of generations in the tree.
-            print_tree, print_tree_sparse:
-                boolean - for toggling diagnostic printouts. Print_tree_sparse
-                prints less.
-            game:
-                object - instance of a class for a game e.g. Connect_Four.
-                Must have methods rollout, actions_available, set_print_game,
-                play, print_board, get_reward and the attribute player_turn.
+            game, max_depth:
+                as for the arguments of the same name.
             player_num:
                 int - which player is selecting a move.
             sim_game:
-                object of same type as game. The current simulation.
+                object of same type as game. The current simulation. It is
+                copied from game once, then reset to root_snapshot at the
+                start of every iteration rather than copied again.
+            root_snapshot:
+                object returned by game.snapshot() - the state of game when
+                the search started.
+            batch_size:
+                int - number of leaves rolled out together per iteration.
+            pool, num_searches:
+                as for the arguments of the same name.
+            num_threads:
+                as for the argument of the same name.
+            exploration, table_size:
+                as for the arguments of the same name.
+            transposition_table:
+                collections.OrderedDict mapping position hash to Node, in
+                order of least to most recently used, or None if
+                transpositions is False.
+            tree_lock:
+                threading.Lock - guards the tree during tree-parallel MCTS.
+            max_iterations, max_nodes, deadline, early_stop:
+                as for the arguments of the same name.
+            clock_check_interval:
+                int - number of iterations between checks of the clock.
+            num_nodes:
+                int - number of nodes in the tree.
+            iterations:
+                int - number of iterations run by the last search.
+            sims_per_second:
+                float - simulations per second achieved by the last call to
+                run_MCTS, summed across all workers for root-parallel MCTS.
+            collect_stats, stats_callback, stats_every, rollout_policy:
+                as for the arguments of the same name.
+            evaluator, value_weight, c_puct, book, solver, endgame_solver:
+                as for the arguments of the same name.
+            lazy_expansion, widening:
+                as for the arguments of the same name.
+            stats:
+                MCTS_Stats - stats of the last search if collect_stats, else
+                None.
         '''
         self.seconds_allowed = time
-        self.root = Node(99,1-game.player_turn)
         self.total_sims = 0
-        self.max_depth = 9
-        self.print_tree = False
-        self.print_tree_sparse = False
+        self.max_depth = max_depth
+        self.lazy_expansion = lazy_expansion or widening is not None
+        self.widening = widening
         self.game = game
         self.player_num = self.game.player_turn
         self.sim_game = copy.deepcopy(game)
-        self.root.expand(self.sim_game.actions_available(),
-                         self.sim_game.player_turn)
+        self.sim_game.set_print_game(False)
+        self.root_snapshot = self.sim_game.snapshot()
+        self.batch_size = batch_size
+        self.pool = pool
+        self.num_searches = num_searches or pool_workers(pool)
+        self.num_threads = num_threads
+        self.exploration = exploration
+        self.transposition_table = collections.OrderedDict() if transpositions else None
+        self.table_size = table_size
+        self.tree_lock = threading.Lock()
+        self.max_iterations = max_iterations
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.early_stop = early_stop
+        self.clock_check_interval = 16
+        self.iterations = 0
+        self.sims_per_second = 0
+        self.collect_stats = collect_stats or stats_callback is not None
+        self.stats_callback = stats_callback
+        self.stats_every = stats_every
+        self.stats = None
+        self.rollout_policy = rollout_policy
+        self.evaluator = evaluator
+        self.value_weight = value_weight
+        self.c_puct = c_puct
+        self.book = book
+        self.solver = solver
+        self.endgame_solver = endgame_solver
+        if self.lazy_expansion and evaluator is not None:
+            raise Exception('lazy expansion is not supported with an evaluator')
+        self.init_tree()
+    
+    def init_tree(self):
+        '''Creates the root of the tree, expanded with a child for each action available in game.'''
+        self.root = Node(None, 1-self.game.player_turn)
+        self.num_nodes = 1
+        if self.transposition_table is not None:
+            self.transposition_table.clear()
+        self.expand(self.root, self.sim_game.legal_actions(), self.sim_game)
+        self.root.untried = [] #the root's children are all created up front, see lazy_expansion
+        if self.evaluator is not None:
+            self.evaluate_root()
     
-    def run_MCTS(self):
-        '''Runs MCTS to completion, returning the (int) action selected.'''
+    def advance(self, actions):
+        '''Moves the root of the tree down by the actions played in game since the last search
+        (e.g. this player's move and the opponent's reply), so that the statistics gathered for
+        the resulting position are kept for the next search. The rest of the tree is discarded.
+        Must be called after the actions have been played on game.
+        
+        Arguments:
+            actions:
+                iterable of ints - actions played, in order, starting from the position of the
+                current root.
+        '''
+        self.sim_game = copy.deepcopy(self.game)
+        self.sim_game.set_print_game(False)
+        self.root_snapshot = self.sim_game.snapshot()
+        self.player_num = self.game.player_turn
+        node = self.root
+        for action in actions:
+            if action not in node.child_actions:
+                self.total_sims = 0
+                self.init_tree()
+                return
+            node = node.children[node.child_actions.index(action)]
+        node.parent = None
+        self.root = node
+        self.total_sims = node.num_sims
+        nodes = node.reachable()
+        self.num_nodes = len(nodes)
+        if self.transposition_table is not None:
+            self.prune_table(nodes)
+        actions = self.sim_game.legal_actions()
+        if node.children == [] and actions:
+            self.expand(node, actions, self.sim_game)
+        elif node.untried:
+            self.expand(node, node.untried, self.sim_game)
+        node.untried = [] #the root's children are all created up front, see lazy_expansion
+        if self.evaluator is not None and node.child_priors is None:
+            self.evaluate_root()
+    
+    def run_MCTS(self, callback=None, report_every=1000):
+        '''Runs MCTS until a budget runs out (see the arguments time, max_iterations, max_nodes,
+        deadline and early_stop), returning the (int) action selected.
+        
+        Arguments:
+            callback:
+                function - called as callback(iterations, action, confidence) every
+                report_every iterations of a search in this process (see 'anytime'). If it
+                returns True, the search stops there.
+            report_every:
+                int - number of iterations between calls to callback.
+        '''
         start_time = time.time()
-        actions = self.game.actions_available()
+        self.stats = None
+        actions = self.game.legal_actions()
         if len(actions) == 1:
+            self.iterations = 0
+            self.sims_per_second = 0
             return actions[0]
-        i = 0
-        while time.time() - start_time < self.seconds_allowed:
-            self.iteration()
-            i += 1
-            if self.print_tree_sparse:
-                if i % 100 == 0:
-                    print("iteration ", i)
-                    print("Root child UCBs: ", self.root.children_UCB)
-                    print("Root child Avgs: ", self.root.children_avg)
+        if self.book is not None:
+            entry = self.book.lookup(self.game.get_hash())
+            if entry is not None:
+                total_sims, child_stats = entry
+                if total_sims >= self.book.min_sims:
+                    self.iterations = 0
+                    self.sims_per_second = 0
+                    return self.book.best_action(child_stats)
+                if self.root.num_sims == 0: #only warm start a new tree
+                    self.total_sims += total_sims
+                    self.add_root_child_stats(total_sims, child_stats)
+        start_sims = self.total_sims #after any warm start, so only this search's simulations count
+        if self.pool is not None:
+            self.root_parallel_search()
+        elif self.num_threads > 1:
+            self.tree_parallel_search()
+        else:
+            for report in self.anytime(report_every if callback is not None else None):
+                if callback is not None and callback(*report):
+                    break
+        self.sims_per_second = (self.total_sims - start_sims) / (time.time() - start_time)
+        if self.book is not None:
+            self.book.store(self.game.get_hash(), self.root_child_stats())
         return self.choose_move()
     
+    def get_deadline(self, start_time):
+        '''Returns the time.time() value at which a search started at start_time must stop, or
+        None if it has no time limit.
+        '''
+        deadlines = [deadline for deadline in (self.deadline,) if deadline is not None]
+        if self.seconds_allowed is not None:
+            deadlines.append(start_time + self.seconds_allowed)
+        if not deadlines and self.max_iterations is None and self.max_nodes is None:
+            raise Exception('MCTS needs at least one of time, max_iterations, max_nodes or '
+                            'deadline')
+        return min(deadlines) if deadlines else None
+    
+    def anytime(self, report_every=1000):
+        '''Generator that runs iterations of MCTS in this process until a budget runs out,
+        yielding the current best move every report_every iterations (never if None), and once
+        more when the search stops. The caller may stop the search at any point by no longer
+        iterating, and then call 'choose_move'.
+        
+        Yields tuple of (iterations so far, action that choose_move would currently return,
+        confidence), where confidence is the fraction of the root's simulations that went to
+        that action.
+        
+        With collect_stats, the search's stats are collected in a new MCTS_Stats object (see
+        'instrumented_methods'), and stats_callback is called every stats_every iterations.
+        '''
+        start_time = time.time()
+        deadline = self.get_deadline(start_time)
+        max_iterations = self.max_iterations
+        max_nodes = self.max_nodes
+        next_check = self.clock_check_interval
+        next_report = report_every
+        stats_callback = self.stats_callback
+        next_stats = self.stats_every
+        solver = self.solver
+        i = 0
+        self.stats = MCTS_Stats() if self.collect_stats else None
+        if self.stats is not None:
+            self.stats.attach(self)
+        try:
+            while True:
+                if self.batch_size > 1 or self.evaluator is not None:
+                    batch_size = self.batch_size
+                    if max_iterations is not None:
+                        batch_size = min(batch_size, max_iterations - i)
+                    self.batch_iteration(batch_size)
+                    i += batch_size
+                else:
+                    self.iteration()
+                    i += 1
+                self.iterations = i
+                
+                stop = (max_iterations is not None and i >= max_iterations) or (
+                    max_nodes is not None and self.node_count() >= max_nodes) or (
+                    solver and self.root.proven is not None)
+                if not stop and i >= next_check:
+                    next_check = i + self.clock_check_interval
+                    now = time.time()
+                    if deadline is not None and now >= deadline:
+                        stop = True
+                    elif self.early_stop:
+                        stop = self.decided(self.iterations_remaining(i, start_time, now, deadline))
+                if stats_callback is not None and i >= next_stats:
+                    next_stats = i + self.stats_every
+                    self.stats.update(self)
+                    stats_callback(self.stats)
+                if stop or (report_every is not None and i >= next_report):
+                    if report_every is not None:
+                        next_report = i + report_every
+                    yield (i,) + self.best_move_confidence()
+                if stop:
+                    return
+        finally:
+            if self.stats is not None:
+                self.stats.detach(self)
+    
+    def iterations_remaining(self, iterations, start_time, now, deadline):
+        '''Returns the number of iterations left in a search that has run iterations so far, with
+        the number the time left allows estimated from the rate so far.
+        '''
+        remaining = math.inf
+        if self.max_iterations is not None:
+            remaining = self.max_iterations - iterations
+        if deadline is not None and now > start_time:
+            remaining = min(remaining, (deadline - now) * iterations / (now - start_time))
+        return remaining
+    
+    def decided(self, remaining):
+        '''Returns True if the action choose_move would pick cannot be overtaken in remaining
+        more simulations (rewards being between -1 and 1): its average reward if they all went
+        to it and were losses, (reward_sum - remaining) / (num_sims + remaining), is still above
+        the average any other action would have if they all went to it and were wins,
+        (reward_sum + remaining) / (num_sims + remaining). With the solver, actions proven to
+        lose are never chosen, so are not counted as rivals.
+        '''
+        stats = self.root_child_stats()
+        if len(stats) < 2:
+            return True
+        if remaining == math.inf:
+            return False
+        best_action = self.choose_move()
+        lost = set()
+        if self.solver:
+            lost = {child.action for child in self.root.children if child.proven == -1}
+            if best_action in lost:
+                return False
+        worst = None
+        best_rival = -math.inf
+        for action, num_sims, reward_sum in stats:
+            if num_sims + remaining == 0:
+                continue #unvisited, and staying so
+            if action == best_action:
+                worst = (reward_sum - remaining) / (num_sims + remaining)
+            elif action not in lost:
+                best_rival = max(best_rival, (reward_sum + remaining) / (num_sims + remaining))
+        return worst is not None and worst > best_rival
+    
+    def best_move_confidence(self):
+        '''Returns tuple of the action choose_move would currently return, and the fraction of
+        the root's simulations spent on it.
+        '''
+        stats = self.root_child_stats()
+        action = self.choose_move()
+        total = sum(num_sims for _, num_sims, _ in stats)
+        num_sims = next(num_sims for child_action, num_sims, _ in stats if child_action == action)
+        return action, num_sims / total if total else 0
+    
+    def node_count(self):
+        '''Returns the number of nodes in the tree.'''
+        return self.num_nodes
+    
+    def root_parallel_search(self):
+        '''Runs num_searches independent searches from the root in pool, each with an equal share
+        of the iteration and node budgets and the same deadline, and adds the statistics of their
+        root children to this tree's root children.
+        '''
+        if self.evaluator is not None:
+            raise Exception('root-parallel MCTS does not support an evaluator')
+        settings = self.search_settings()
+        settings['deadline'] = self.get_deadline(time.time())
+        for budget in ('max_iterations', 'max_nodes'):
+            if getattr(self, budget) is not None:
+                settings[budget] = max(1, getattr(self, budget) // self.num_searches)
+        seed = random.getrandbits(32)
+        futures = [
+            self.pool.submit(_root_parallel_search, type(self), self.game, settings, seed + i)
+            for i in range(self.num_searches)
+        ]
+        self.iterations = 0
+        for future in futures:
+            total_sims, child_stats = future.result()
+            self.total_sims += total_sims
+            self.iterations += total_sims
+            self.add_root_child_stats(total_sims, child_stats)
+    
+    def search_settings(self):
+        '''Returns dict of the keyword arguments needed to create a search with the same settings
+        as this one, for root-parallel workers.
+        '''
+        return {'batch_size': self.batch_size, 'exploration': self.exploration,
+                'transpositions': self.transposition_table is not None,
+                'table_size': self.table_size, 'early_stop': self.early_stop,
+                'rollout_policy': self.rollout_policy, 'solver': self.solver,
+                'endgame_solver': self.endgame_solver, 'max_depth': self.max_depth,
+                'lazy_expansion': self.lazy_expansion, 'widening': self.widening}
+    
+    def root_child_stats(self):
+        '''Returns list of (action, num_sims, reward_sum) for each child of the root.'''
+        return [(action, child.num_sims, child.reward_sum)
+                for action, child in zip(self.root.child_actions, self.root.children)]
+    
+    def add_root_child_stats(self, total_sims, child_stats):
+        '''Adds total_sims simulations to the root, and the statistics in child_stats (as returned
+        by 'root_child_stats') to the root's children.
+        '''
+        children = dict(zip(self.root.child_actions, self.root.children))
+        self.root.num_sims += total_sims
+        for action, num_sims, reward_sum in child_stats:
+            children[action].num_sims += num_sims
+            children[action].reward_sum += reward_sum
+    
+    def tree_parallel_search(self):
+        '''Runs num_threads worker threads (see 'tree_parallel_worker') on this tree until a budget
+        runs out. early_stop is not applied.
+        '''
+        deadline = self.get_deadline(time.time())
+        self.iterations = 0
+        threads = [
+            threading.Thread(target=self.tree_parallel_worker, args=(deadline,))
+            for _ in range(self.num_threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    def tree_parallel_worker(self, deadline):
+        '''Worker thread for tree-parallel MCTS. Repeatedly selects batch_size leaves of the shared
+        tree with virtual loss, rolls them out on its own copy of the game, then back propogates
+        the results. Only the selection/expansion and back propogation steps hold tree_lock, so
+        the rollouts of different workers may overlap.
+        '''
+        sim_game = copy.deepcopy(self.sim_game)
+        while deadline is None or time.time() < deadline:
+            paths = []
+            snapshots = []
+            with self.tree_lock:
+                batch_size = self.batch_size
+                if self.max_iterations is not None:
+                    batch_size = min(batch_size, self.max_iterations - self.iterations)
+                if batch_size <= 0 or (
+                        self.max_nodes is not None and self.node_count() >= self.max_nodes) or (
+                        self.solver and self.root.proven is not None):
+                    return
+                self.iterations += batch_size
+                for _ in range(batch_size):
+                    path = self.descend(sim_game)
+                    self.add_virtual_loss(path)
+                    paths.append(path)
+                    snapshots.append(sim_game.snapshot())
+            if self.evaluator is not None:
+                sim_results, leaf_priors = self.evaluate_leaves(sim_game, snapshots)
+            elif self.batch_size > 1:
+                sim_results = self.batch_rollout(sim_game, snapshots)
+            else:
+                sim_results = [self.play_out(sim_game)]
+            with self.tree_lock:
+                if self.evaluator is not None:
+                    self.set_priors(paths, leaf_priors)
+                for path, sim_result in zip(paths, sim_results):
+                    if self.solver:
+                        sim_result = self.solved_result(path, sim_result)
+                    self.back_prop(path, sim_result, virtual_loss=True)
+                    if self.solver:
+                        self.propagate_proof(path)
+    
+    def instrumented_methods(self):
+        '''Returns list of (phase, object, method name) for the methods timed by MCTS_Stats when
+        collect_stats is True. The time of 'descend' outside the methods it calls counts as
+        selection, and 'add_virtual_loss' as back propogation.
+        '''
+        return [
+            ('select', self, 'descend'),
+            ('select', self, 'select_index'),
+            ('select', self, 'puct_index'),
+            ('play', self.sim_game, 'play'),
+            ('expand', self, 'expand'),
+            ('expand', self, 'expand_child'),
+            ('rollout', self, 'rollout'),
+            ('rollout', self, 'batch_rollout'),
+            ('evaluate', self, 'evaluate_leaves'),
+            ('back_prop', self, 'add_virtual_loss'),
+            ('back_prop', self, 'back_prop'),
+        ]
+    
     def iteration(self):
         '''Runs one complete iteration of MCTS. Specifially it does:
-        1. Selection (see 'select' method)
+        1. Selection (see 'select_index' method)
         2. Expansion (see 'Node.expand' method)
         3. Rollout (see 'rollout' method)
         4. Back Propogation (see 'back_prop' method)
         '''
+        path = self.descend()
+        sim_result = self.rollout(path)
+        self.back_prop(path, sim_result)
+        if self.solver:
+            self.propagate_proof(path)
+    
+    def batch_iteration(self, batch_size=None):
+        '''Runs batch_size iterations of MCTS (self.batch_size by default), with the rollouts done
+        together. Leaves are found
+        one after another with 'descend', and virtual loss is added along each path (see
+        'add_virtual_loss') so that later descents favour other branches. All the leaves are then
+        rolled out with one call to 'batch_rollout' (or evaluated with 'evaluate_leaves'), and the
+        virtual loss is replaced by the real results in 'back_prop'.
+        '''
+        paths = []
+        snapshots = []
+        for _ in range(batch_size or self.batch_size):
+            path = self.descend()
+            self.add_virtual_loss(path)
+            paths.append(path)
+            snapshots.append(self.sim_game.snapshot())
+        if self.evaluator is None:
+            sim_results = self.batch_rollout(self.sim_game, snapshots)
+        else:
+            sim_results, leaf_priors = self.evaluate_leaves(self.sim_game, snapshots)
+            self.set_priors(paths, leaf_priors)
+        for path, sim_result in zip(paths, sim_results):
+            if self.solver:
+                sim_result = self.solved_result(path, sim_result)
+            self.back_prop(path, sim_result, virtual_loss=True)
+            if self.solver:
+                self.propagate_proof(path)
+    
+    def descend(self, sim_game=None):
+        '''Performs the selection and expansion steps of an iteration, starting from root. Returns
+        the path taken, as a list of nodes from the root to the leaf node reached, with sim_game
+        (self.sim_game by default) left in the position of that leaf.
+        '''
+        if sim_game is None:
+            sim_game = self.sim_game
+        if self.lazy_expansion:
+            return self.lazy_descend(sim_game)
         found_node = False
         curr_node = self.root
-        self.sim_game = copy.deepcopy(self.game)
-        self.sim_game.set_print_game(False)
-        
-        if self.print_tree: print("Selection--------------------------")
+        path = [curr_node]
+        depth_limit = math.inf if self.max_depth is None else curr_node.depth + self.max_depth
+        if self.evaluator is not None:
+            select_index = self.puct_index
+        elif self.solver:
+            select_index = self.solver_index
+        else:
+            select_index = self.select_index
+        sim_game.restore(self.root_snapshot)
         
         while found_node == False:
-            curr_node = self.select(curr_node)
-            if curr_node.action < 0 or (curr_node.action >6):
-                self.sim_game.print_board()
-                print(curr_node)
-            self.sim_game.play(curr_node.action) #self.sim_game.player_turn)
+            index = select_index(curr_node)
+            action = curr_node.child_actions[index]
+            curr_node = curr_node.children[index]
+            path.append(curr_node)
+            sim_game.play(action)
             
-            if curr_node.depth >= self.max_depth:
+            if curr_node.depth >= depth_limit or curr_node.proven is not None:
                 found_node = True
-                if self.print_tree: print("-reached max depth: ", self.max_depth, curr_node.depth)
             elif curr_node.children == []:
                 found_node = True
-                actions = self.sim_game.actions_available()
-                if actions.size != 0:
-                    curr_node.expand(actions, self.sim_game.player_turn)
-                    
-        sim_result = self.rollout(curr_node)
-        self.back_prop(curr_node, sim_result)
-    
-    def rollout(self, curr_node):
-        '''Rollout of the rest of the game from current play state.'''
-        diagnostics = False
-        self.total_sims += 1
-        self.sim_game.rollout()
-        if diagnostics:
-            print("sim end - player ", self.player_num, " gets ", self.sim_game.get_reward())
-            self.sim_game.print_board()
-        return self.sim_game.get_reward()
-    
-    def UCB(self, node):
-        '''calculates upper confidence bound for a given node, using an
-        optimistic high value for nodes with no rollouts.
-        '''    
-        if node.num_sims == 0:
-            return 9999999 + random.random()
+                actions = sim_game.legal_actions()
+                if actions:
+                    self.expand(curr_node, actions, sim_game)
+        if self.solver and curr_node.proven is None:
+            self.prove_leaf(curr_node, sim_game)
+        return path
+    
+    def lazy_descend(self, sim_game):
+        ''''descend' with lazy_expansion: a node's untried actions are listed the second time it is
+        reached, and while it has any (and widening allows another child), the descent creates a
+        child for one of them (see 'expand_child') and stops there. Otherwise it selects among the
+        existing children as usual.
+        '''
+        curr_node = self.root
+        path = [curr_node]
+        depth_limit = math.inf if self.max_depth is None else curr_node.depth + self.max_depth
+        select_index = self.solver_index if self.solver else self.select_index
+        widening = self.widening
+        sim_game.restore(self.root_snapshot)
+        
+        while True:
+            untried = curr_node.untried
+            if untried is None: #(children are only already there in a tree_file.warm_start)
+                untried = curr_node.untried = [action for action in sim_game.legal_actions()
+                                               if action not in curr_node.child_actions]
+            if untried and (widening is None or len(curr_node.children) < math.ceil(
+                    widening[0] * max(curr_node.num_sims, 1) ** widening[1])):
+                action, curr_node = self.expand_child(curr_node, sim_game)
+                path.append(curr_node)
+                sim_game.play(action)
+                break
+            if not curr_node.children: #the game is over
+                break
+            index = select_index(curr_node)
+            action = curr_node.child_actions[index]
+            curr_node = curr_node.children[index]
+            path.append(curr_node)
+            sim_game.play(action)
+            #only the root's children can be reached before they have been rolled out
+            if curr_node.depth >= depth_limit or curr_node.proven is not None or (
+                    curr_node.num_sims == 0):
+                break
+        if self.solver and curr_node.proven is None:
+            self.prove_leaf(curr_node, sim_game)
+        return path
+    
+    def prune_table(self, nodes):
+        '''Removes from the transposition table every node not in nodes (e.g. those discarded by
+        'advance'), so that they are freed and never linked back into the tree. The remaining
+        entries keep their least-recently-used order.
+        '''
+        kept = {id(node) for node in nodes}
+        table = self.transposition_table
+        for key in [key for key, node in table.items() if id(node) not in kept]:
+            del table[key]
+
+    def expand(self, node, actions_available, sim_game):
+        '''Perform expand step of MCTS for node, whose position is the current state of sim_game
+        (see 'Node.expand'). With a transposition table, a child whose position is already in the
+        table is linked to the existing node rather than getting a new one.
+        '''
+        if self.transposition_table is None:
+            node.expand(actions_available, sim_game.player_turn)
+            self.num_nodes += len(actions_available)
+            return
+        for action in actions_available:
+            self.transposed_child(node, action, sim_game)
+    
+    def expand_child(self, node, sim_game):
+        '''Lazy expansion step for node, whose position is the current state of sim_game: removes
+        an action chosen at random from node.untried, and gives node a child for it (linked to an
+        existing node through the transposition table, if there is one).
+        
+        Returns tuple of the action and the child.
+        '''
+        untried = node.untried
+        index = random.randrange(len(untried))
+        action = untried[index]
+        untried[index] = untried[-1]
+        untried.pop()
+        if self.transposition_table is None:
+            node.child_node(action, sim_game.player_turn)
+            self.num_nodes += 1
         else:
-            return (node.reward_sum / node.num_sims) + math.sqrt(
-                (2 * math.log(self.total_sims)) / node.num_sims
-            )
+            self.transposed_child(node, action, sim_game)
+        return action, node.children[-1]
     
-    def update_children_UCB(self, node):
-        node.children_UCB = []
-        for child in node.children:
-            node.children_UCB.append(self.UCB(child))
+    def transposed_child(self, node, action, sim_game):
+        '''Adds a child for action to node, whose position is the current state of sim_game, using
+        the node for the resulting position in the transposition table if there is one, and
+        adding a new node to the table otherwise.
+        '''
+        table = self.transposition_table
+        key = sim_game.hash_after(action)
+        child = table.get(key)
+        if child is None:
+            node.child_node(action, sim_game.player_turn)
+            self.num_nodes += 1
+            table[key] = node.children[-1]
+            if len(table) > self.table_size:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+            node.add_child(child, action)
+    
+    def rollout(self, path):
+        '''Rollout of the rest of the game from current play state, i.e. from the leaf at the end
+        of path.
+        '''
+        self.total_sims += 1
+        if self.solver and path[-1].proven is not None:
+            return self.proven_result(path[-1])
+        return self.play_out(self.sim_game)
+    
+    def play_out(self, sim_game):
+        '''Plays out sim_game from its current position with rollout_policy (or the game's own
+        rollout if None), returning the rewards for players (0, 1).
+        '''
+        if self.rollout_policy is None:
+            sim_game.rollout()
+            return sim_game.get_reward()
+        return self.rollout_policy.rollout(sim_game)
+    
+    def batch_rollout(self, sim_game, snapshots):
+        '''Plays out every position in snapshots with rollout_policy (or the game's own
+        batch_rollout if None), using sim_game. Returns the rewards for players (0, 1) of each.
+        '''
+        if self.rollout_policy is None:
+            return sim_game.batch_rollout(snapshots)
+        return self.rollout_policy.batch_rollout(sim_game, snapshots)
+    
+    def evaluate_leaves(self, sim_game, snapshots):
+        '''Evaluates the leaves captured in snapshots with evaluator, using sim_game. The result
+        of a leaf where the game is over is its reward; otherwise it is the network's value, mixed
+        with the result of a rollout if value_weight is below 1.
+        
+        Returns tuple of list of results (rewards for players (0, 1)), and list of the network's
+        priors over all actions at each leaf (None where the game is over).
+        '''
+        evaluator = self.evaluator
+        results = []
+        players = [] #player to move at each leaf, or None if the game is over
+        states = []
+        for snapshot in snapshots:
+            sim_game.restore(snapshot)
+            results.append(sim_game.get_reward())
+            if sim_game.game_over:
+                players.append(None)
+            else:
+                players.append(sim_game.player_turn)
+                states.append(evaluator.encode(sim_game))
+        outputs = iter(evaluator.evaluate(states))
+        weight = self.value_weight
+        rollouts = self.batch_rollout(sim_game, snapshots) if weight < 1 else None
+        leaf_priors = []
+        for i, player in enumerate(players):
+            if player is None:
+                leaf_priors.append(None)
+                continue
+            priors, value = next(outputs)
+            leaf_priors.append(priors)
+            if player == 1: #value is for the player to move, results are from player 0's view
+                value = -value
+            if rollouts is not None:
+                value = weight * value + (1 - weight) * float(rollouts[i][0])
+            results[i] = (value, -value)
+        return results, leaf_priors
+    
+    def evaluate_root(self):
+        '''Sets the priors of the root's children from an evaluation of the root's position.'''
+        self.sim_game.restore(self.root_snapshot)
+        if self.root.children and not self.sim_game.game_over:
+            [(priors, _)] = self.evaluator.evaluate([self.evaluator.encode(self.sim_game)])
+            self.set_priors([[self.root]], [priors])
+    
+    def set_priors(self, paths, leaf_priors):
+        '''For the leaf at the end of each path, stores the prior probabilities of its children
+        (from leaf_priors, over all actions) in leaf.child_priors, renormalised over the actions
+        it has. Leaves already given priors, e.g. through a transposition, are left as they are.
+        '''
+        for path, priors in zip(paths, leaf_priors):
+            node = path[-1]
+            if priors is None or not node.children or node.child_priors is not None:
+                continue
+            child_priors = [float(priors[action]) for action in node.child_actions]
+            total = sum(child_priors)
+            if total > 0:
+                node.child_priors = [prior / total for prior in child_priors]
+            else:
+                node.child_priors = [1 / len(child_priors)] * len(child_priors)
+    
+    def prove_leaf(self, node, sim_game):
+        '''Marks node, whose position is the current state of sim_game, with its exact value if
+        the game is over there or endgame_solver solves it (see 'solver').
+        '''
+        if sim_game.game_over:
+            node.proven = sim_game.get_reward()[node.player_num]
+        elif self.endgame_solver is not None:
+            value = self.endgame_solver(sim_game)
+            if value is not None:
+                node.proven = -value #value is for the player to move, i.e. node's opponent
+    
+    def proven_result(self, node):
+        '''Returns the rewards for players (0, 1) given by node's exact value.'''
+        value = node.proven if node.player_num == 0 else -node.proven
+        return (value, -value)
+    
+    def solved_result(self, path, sim_result):
+        '''Returns the exact result for the leaf at the end of path if it has been proven, else
+        sim_result.
+        '''
+        return sim_result if path[-1].proven is None else self.proven_result(path[-1])
+    
+    def propagate_proof(self, path):
+        '''Marks the nodes on path with their exact values where the values of their children
+        decide them: a node is lost for its player if a child wins for the opponent choosing it,
+        and otherwise has the opposite of its best child's value once every child is proven.
+        Stops at the first node that is not decided.
+        '''
+        for index in range(len(path) - 1, 0, -1):
+            child = path[index]
+            parent = path[index - 1]
+            if child.proven is None or parent.proven is not None:
+                return
+            if child.proven == 1:
+                parent.proven = -1
+            elif parent.untried: #see lazy_expansion
+                return
+            else:
+                values = [sibling.proven for sibling in parent.children]
+                if None in values:
+                    return
+                parent.proven = -max(values)
     
     def update_children_avg(self, node):
         node.children_avg = []
@@ -135,73 +1080,181 @@ class MCTS():
             else:
                 node.children_avg.append(child.reward_sum / child.num_sims)
     
-    def select(self, node):
-        '''For a given node, returns the child node with greatest upper confidence bound.'''
-        self.update_children_UCB(node)
-        return node.children[ #returning child with best UCB
-            max(zip(node.children_UCB, range(len(node.children_UCB))))[1] #this is same as argmax
-        ]
+    def select_index(self, node):
+        '''For a given node, returns the index of the child node with greatest upper confidence
+        bound: its average reward plus sqrt(exploration * log(total_sims) / num_sims), or an
+        optimistic high value for children with no rollouts. Computed in a single pass over the
+        children, with the log term that they share calculated once. Ties go to the last child,
+        as with max(zip(UCBs, indices)).
+        '''
+        total_sims = self.total_sims
+        explore = self.exploration * math.log(total_sims) if total_sims else 0
+        best_index = 0
+        best_UCB = -math.inf
+        for index, child in enumerate(node.children):
+            num_sims = child.num_sims
+            if num_sims == 0:
+                UCB = 9999999 + random.random()
+            else:
+                UCB = child.reward_sum / num_sims + math.sqrt(explore / num_sims)
+            if UCB >= best_UCB:
+                best_UCB = UCB
+                best_index = index
+        return best_index
+    
+    def puct_index(self, node):
+        '''For a given node, returns the index of the child with the greatest PUCT score,
+        Q + c_puct * prior * sqrt(node.num_sims) / (1 + num_sims), where Q is the child's average
+        reward (0 if unvisited) and prior comes from the evaluator (uniform until the node has been
+        evaluated). Used for selection instead of 'select_index' when there is an evaluator. Ties
+        go to the last child, as in 'select_index'.
+        '''
+        priors = node.child_priors
+        if priors is None:
+            priors = [1 / len(node.children)] * len(node.children)
+        explore = self.c_puct * math.sqrt(max(node.num_sims, 1))
+        best_index = 0
+        best_score = -math.inf
+        for index, (child, prior) in enumerate(zip(node.children, priors)):
+            if child.proven == -1: #see 'solver'
+                continue
+            num_sims = child.num_sims
+            score = explore * prior / (1 + num_sims)
+            if num_sims:
+                score += child.reward_sum / num_sims
+            if score >= best_score:
+                best_score = score
+                best_index = index
+        return best_index
     
-    def back_prop(self, curr_node, result):
-        '''Increments the number of simulations and total reward for each ancestor of curr_node.
+    def solver_index(self, node):
+        '''As 'select_index', but never selecting children proven to lose for the player choosing
+        (see 'solver'), unless they all are.
+        '''
+        total_sims = self.total_sims
+        explore = self.exploration * math.log(total_sims) if total_sims else 0
+        best_index = 0
+        best_UCB = -math.inf
+        for index, child in enumerate(node.children):
+            if child.proven == -1:
+                continue
+            num_sims = child.num_sims
+            if num_sims == 0:
+                UCB = 9999999 + random.random()
+            else:
+                UCB = child.reward_sum / num_sims + math.sqrt(explore / num_sims)
+            if UCB >= best_UCB:
+                best_UCB = UCB
+                best_index = index
+        return best_index
+    
+    def add_virtual_loss(self, path):
+        '''Counts a pending simulation as a loss for each node on path, so that it looks less
+        promising to other descents until its real result is back propogated. Also counts the
+        simulation in total_sims.
+        '''
+        self.total_sims += 1
+        for curr_node in path:
+            curr_node.num_sims += 1
+            curr_node.reward_sum -= 1
+    
+    def back_prop(self, path, result, virtual_loss=False):
+        '''Increments the number of simulations and total reward for each node on the path taken
+        by an iteration. The path is used rather than parent links, as with transpositions a node
+        may have several parents.
         
         Arguments:
-            curr_node:
-                Node - Node from which to back_propogate from (inclusive).
+            path:
+                list of Nodes - from the root to the leaf, as returned by 'descend'.
             result:
                 iterable of length 2 - reward for back propogating for players 1, 2 respectively.
+            virtual_loss:
+                boolean - whether 'add_virtual_loss' was called for path. If so the
+                simulation has already been counted, and the virtual loss is removed.
         '''
-        curr_node.num_sims += 1
-        curr_node.reward_sum += result[curr_node.player_num]
-        
-        while curr_node.parent != None:
-            curr_node = curr_node.parent
-            curr_node.num_sims += 1
-            curr_node.reward_sum += result[curr_node.player_num]
+        if virtual_loss:
+            sims, offset = 0, 1
+        else:
+            sims, offset = 1, 0
+        for curr_node in path:
+            curr_node.num_sims += sims
+            curr_node.reward_sum += result[curr_node.player_num] + offset
     
     def choose_move(self):
         '''From the actions available to the player (i.e., the root nodes children), returns the
         action with the greatest average reward in simulations.'''
         node = self.root
         self.update_children_avg(node)
-        if self.print_tree:
-            print("avg values of actions: ", node.children_avg)
-            print()
-        return node.children[ #returning child with best avg
-            max(zip(node.children_avg, range(len(node.children_avg))))[1] #this is same as argmax
-        ].action
+        avgs = [-math.inf if avg is None else avg for avg in node.children_avg] #unvisited last
+        if self.solver:
+            #proven wins first and proven losses last, whatever their averages
+            for index, child in enumerate(node.children):
+                if child.proven is not None and child.proven != 0:
+                    avgs[index] = 2 * child.proven
+        return node.child_actions[ #returning action of child with best avg
+            max(zip(avgs, range(len(avgs))))[1] #this is same as argmax
+        ]
     
 class Node():
+    #nodes are allocated by the million, so they have slots rather than a __dict__
+    __slots__ = ('action', 'num_sims', 'reward_sum', 'children', 'child_actions', 'parent', 'depth',
+                 'proven', 'untried', 'children_avg', 'child_priors', 'player_num')
+
     def __init__(self, action, player_num):
         '''Nodes in a Monte Carlo Tree Search Tree.
 
         Arguments:
-            action:     int - action taken to get to this node
+            action:     int - action taken to get to this node (None for the root)
             player_num: int - which player takes the action to get to this node (need to confirm)
         '''
-        if action < 0 or (action >6 and action != 99):
-            raise Exception('wtf: {}'.format(action))
         self.action = action
         self.num_sims = 0
         self.reward_sum = 0
         self.children = []
+        self.child_actions = []
         self.parent = None
         self.depth = 0
-#             self.is_terminal = False
-        self.children_UCB = []
-        self.children_avg = []
+        self.proven = None #exact value for player_num once decided, see the solver argument of MCTS
+        self.untried = None #actions without a child yet, see the lazy_expansion argument of MCTS
+        self.children_avg = None #set by MCTS.update_children_avg
+        self.child_priors = None
         self.player_num = player_num
 
     def child_node(self, action, player_num):
         '''Add a child node from this node.'''
         self.children.append(Node(action, player_num))
+        self.child_actions.append(action)
         self.children[-1].parent = self
         self.children[-1].depth = self.depth + 1
+    
+    def add_child(self, node, action):
+        '''Add an existing node (a transposition) as a child of this node, reached by action. The
+        node keeps its original parent.
+        '''
+        self.children.append(node)
+        self.child_actions.append(action)
 
     def expand(self, actions_available, player_num):
         '''Perform expand step of MCTS, creating a new child node for each available action.'''
         for action in actions_available:
-            self.child_node(action.item(), player_num)
+            self.child_node(action, player_num)
+    
+    def reachable(self):
+        '''Returns list of the distinct nodes reachable from this node (inclusive).'''
+        seen = {id(self)}
+        nodes = [self]
+        stack = [self]
+        while stack:
+            for child in stack.pop().children:
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    nodes.append(child)
+                    stack.append(child)
+        return nodes
+
+    def count_nodes(self):
+        '''Returns the number of distinct nodes reachable from this node (inclusive).'''
+        return len(self.reachable())
     
     @staticmethod
     def print_tree_floor(node, max_depth):
@@ -211,7 +1264,7 @@ class Node():
             print(node)
         else:
             for obj in node.children:
-                print_tree_bottom(obj, max_depth)
+                Node.print_tree_floor(obj, max_depth)
     
     def __str__(self):
         return 'Node with action={}, player_turn={},num_sims={} reward_sum={}, depth={}'.format(
@@ -0,0 +1,294 @@
+import math
+import random
+import copy
+
+import numpy as np
+
+from MCTS import MCTS
+
+class Array_Tree():
+    '''Monte Carlo Tree Search tree held as a set of preallocated numpy arrays (one entry per node)
+    rather than as Node objects. The children of a node are stored contiguously, so a node only
+    needs the index of its first child and its number of children.
+
+    Arguments:
+        capacity:
+            int - number of nodes to allocate space for initially. The arrays double in size
+            whenever they run out of space.
+
+    Attributes:
+        size:
+            int - number of nodes in the tree. Node 0 is the root.
+        capacity:
+            int - number of nodes there is currently space for.
+        action:
+            numpy array of ints - action taken to get to each node (-1 for the root)
+        player_num:
+            numpy array of ints - which player takes the action to get to each node
+        parent:
+            numpy array of ints - index of each node's parent (-1 for the root)
+        first_child, child_count:
+            numpy arrays of ints - index of each node's first child, and its number of children
+        depth:
+            numpy array of ints - number of generations below the root of each node
+        num_sims:
+            numpy array of ints - number of simulations through each node
+        reward_sum:
+            numpy array of floats - total reward of simulations through each node, for the player
+            indicated by player_num
+    '''
+    FIELDS = [
+        ('action', np.int32),
+        ('player_num', np.int8),
+        ('parent', np.int32),
+        ('first_child', np.int32),
+        ('child_count', np.int32),
+        ('depth', np.int32),
+        ('num_sims', np.int32),
+        ('reward_sum', np.float64),
+    ]
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.capacity = capacity
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def reserve(self, size):
+        '''Grows the arrays, if needed, so that there is space for size nodes.'''
+        if size <= self.capacity:
+            return
+        while self.capacity < size:
+            self.capacity *= 2
+        for name, _ in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add_root(self, player_num):
+        '''Adds the root node (with no action) and returns its index.'''
+        self.reserve(1)
+        self.action[0] = -1
+        self.player_num[0] = player_num
+        self.parent[0] = -1
+        self.size = 1
+        return 0
+
+    def expand(self, node, actions_available, player_num):
+        '''Creates a new child of node for each available action, stored contiguously.'''
+        count = len(actions_available)
+        first = self.size
+        self.reserve(first + count)
+        children = slice(first, first + count)
+        self.action[children] = actions_available
+        self.player_num[children] = player_num
+        self.parent[children] = node
+        self.depth[children] = self.depth[node] + 1
+        self.first_child[node] = first
+        self.child_count[node] = count
+        self.size = first + count
+
+    def children(self, node):
+        '''Returns range of the indices of node's children.'''
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node])
+
+    def subtree(self, node):
+        '''Returns a new Array_Tree holding only node and its descendants, with node as the root
+        (index 0) and depths counted from it. Nodes are copied a generation at a time, so the
+        children of each node stay contiguous.
+        '''
+        generations = [np.array([node])]
+        while True:
+            parents = generations[-1]
+            counts = self.child_count[parents].astype(np.int64)
+            total = counts.sum()
+            if total == 0:
+                break
+            #index of every child of parents: each parent's first child plus 0, 1, ..., count-1
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            generations.append(np.repeat(self.first_child[parents], counts) + offsets)
+        old_index = np.concatenate(generations)
+
+        tree = Array_Tree(max(len(old_index), 1024))
+        tree.size = len(old_index)
+        new_index = np.zeros(self.size, dtype=np.int32)
+        new_index[old_index] = np.arange(len(old_index))
+        for name, _ in self.FIELDS:
+            getattr(tree, name)[:tree.size] = getattr(self, name)[old_index]
+        tree.parent[:tree.size] = new_index[self.parent[old_index]]
+        tree.parent[0] = -1
+        tree.first_child[:tree.size] = np.where(
+            self.child_count[old_index] > 0, new_index[self.first_child[old_index]], 0
+        )
+        tree.depth[:tree.size] -= self.depth[node]
+        return tree
+
+    def nbytes(self):
+        '''Returns the number of bytes used by the nodes in the tree.'''
+        return self.size * sum(np.dtype(dtype).itemsize for _, dtype in self.FIELDS)
+
+class Array_MCTS(MCTS):
+    '''MCTS with the tree held in an Array_Tree instead of Node objects. Takes the same arguments
+    and selects the same moves as MCTS, but uses far less memory per node.
+
+    Nodes are referred to by their index in tree. 'descend' returns the numpy array of node
+    indices on the path from the root to the leaf rather than a single node, so that
+    'add_virtual_loss' and 'back_prop' can update every node on the path in one operation.
+
+    Attributes (in addition to those of MCTS):
+        tree:
+            Array_Tree - the search tree. root is 0, its first node.
+    '''
+    def init_tree(self):
+        '''Creates the root of the tree, expanded with a child for each action available in game.'''
+        if self.transposition_table is not None:
+            raise Exception('Array_MCTS does not support transpositions')
+        if self.evaluator is not None:
+            raise Exception('Array_MCTS does not support an evaluator')
+        if self.solver:
+            raise Exception('Array_MCTS does not support the solver')
+        if self.lazy_expansion:
+            raise Exception('Array_MCTS does not support lazy expansion')
+        self.tree = Array_Tree()
+        self.root = self.tree.add_root(1-self.game.player_turn)
+        self.tree.expand(self.root, self.sim_game.legal_actions(), self.sim_game.player_turn)
+
+    def advance(self, actions):
+        '''Moves the root of the tree down by the actions played in game since the last search,
+        keeping only the subtree below the new root (see MCTS.advance).
+        '''
+        self.sim_game = copy.deepcopy(self.game)
+        self.sim_game.set_print_game(False)
+        self.root_snapshot = self.sim_game.snapshot()
+        self.player_num = self.game.player_turn
+        tree = self.tree
+        node = self.root
+        for action in actions:
+            node = next((child for child in tree.children(node) if tree.action[child] == action),
+                        None)
+            if node is None:
+                self.total_sims = 0
+                self.init_tree()
+                return
+        self.tree = tree = tree.subtree(node)
+        self.total_sims = int(tree.num_sims[self.root])
+        actions = self.sim_game.legal_actions()
+        if tree.child_count[self.root] == 0 and actions:
+            tree.expand(self.root, actions, self.sim_game.player_turn)
+
+    def descend(self, sim_game=None):
+        '''Performs the selection and expansion steps of an iteration, starting from root. Returns
+        the path of node indices from the root to the leaf node reached, with sim_game
+        (self.sim_game by default) left in the position of that leaf.
+        '''
+        if sim_game is None:
+            sim_game = self.sim_game
+        tree = self.tree
+        node = self.root
+        path = [node]
+        max_depth = math.inf if self.max_depth is None else self.max_depth
+        sim_game.restore(self.root_snapshot)
+        while True:
+            node = self.select(node)
+            path.append(node)
+            sim_game.play(int(tree.action[node]))
+            if tree.depth[node] >= max_depth:
+                break
+            if tree.child_count[node] == 0:
+                actions = sim_game.legal_actions()
+                if actions:
+                    tree.expand(node, actions, sim_game.player_turn)
+                break
+        return np.array(path)
+
+    def select(self, node):
+        '''For a given node index, returns the index of the child with greatest upper confidence
+        bound (see MCTS.select_index), computed for all the children at once.
+        '''
+        tree = self.tree
+        first = tree.first_child[node]
+        children = slice(first, first + tree.child_count[node])
+        num_sims = tree.num_sims[children]
+        unvisited = num_sims == 0
+        #unvisited children get a placeholder count of 1 to avoid dividing by 0, then are overwritten
+        visits = np.maximum(num_sims, 1)
+        ucb = tree.reward_sum[children] / visits + np.sqrt(
+            (self.exploration * math.log(self.total_sims or 1)) / visits
+        )
+        num_unvisited = np.count_nonzero(unvisited)
+        if num_unvisited:
+            ucb[unvisited] = [9999999 + random.random() for _ in range(num_unvisited)]
+        #last index of the greatest value, to break ties the same way as MCTS.select_index
+        return first + len(ucb) - 1 - ucb[::-1].argmax()
+
+    def instrumented_methods(self):
+        '''Returns list of (phase, object, method name) for the methods timed by MCTS_Stats (see
+        MCTS.instrumented_methods). Selection is done by 'select', and expansion by the tree.
+        '''
+        return [
+            ('select', self, 'descend'),
+            ('select', self, 'select'),
+            ('play', self.sim_game, 'play'),
+            ('expand', self.tree, 'expand'),
+            ('rollout', self, 'rollout'),
+            ('rollout', self, 'batch_rollout'),
+            ('back_prop', self, 'add_virtual_loss'),
+            ('back_prop', self, 'back_prop'),
+        ]
+
+    def add_virtual_loss(self, path):
+        '''Counts a pending simulation as a loss for every node on path (see MCTS.add_virtual_loss).'''
+        self.total_sims += 1
+        self.tree.num_sims[path] += 1
+        self.tree.reward_sum[path] -= 1
+
+    def back_prop(self, path, result, virtual_loss=False):
+        '''Increments the number of simulations and total reward for every node on path (see
+        MCTS.back_prop).
+        '''
+        tree = self.tree
+        rewards = np.asarray(result)[tree.player_num[path]]
+        if virtual_loss:
+            tree.reward_sum[path] += rewards + 1
+        else:
+            tree.num_sims[path] += 1
+            tree.reward_sum[path] += rewards
+
+    def node_count(self):
+        '''Returns the number of nodes in the tree.'''
+        return self.tree.size
+
+    def root_child_stats(self):
+        '''Returns list of (action, num_sims, reward_sum) for each child of the root.'''
+        tree = self.tree
+        first = tree.first_child[self.root]
+        return [
+            (int(tree.action[i]), int(tree.num_sims[i]), float(tree.reward_sum[i]))
+            for i in range(first, first + tree.child_count[self.root])
+        ]
+
+    def add_root_child_stats(self, total_sims, child_stats):
+        '''Adds total_sims simulations to the root, and the statistics in child_stats (as returned
+        by 'root_child_stats') to the root's children.
+        '''
+        tree = self.tree
+        first = tree.first_child[self.root]
+        children = {int(tree.action[i]): i
+                    for i in range(first, first + tree.child_count[self.root])}
+        tree.num_sims[self.root] += total_sims
+        for action, num_sims, reward_sum in child_stats:
+            tree.num_sims[children[action]] += num_sims
+            tree.reward_sum[children[action]] += reward_sum
+
+    def choose_move(self):
+        '''From the actions available to the player (i.e., the root nodes children), returns the
+        action with the greatest average reward in simulations.'''
+        tree = self.tree
+        first = tree.first_child[self.root]
+        children = slice(first, first + tree.child_count[self.root])
+        num_sims = tree.num_sims[children]
+        avg = tree.reward_sum[children] / np.maximum(num_sims, 1)
+        avg[num_sims == 0] = -np.inf
+        return int(tree.action[first + len(avg) - 1 - avg[::-1].argmax()])
@@ -0,0 +1,570 @@
+'''Benchmarks for MCTS and the Connect Four engines. Results are printed as JSON, so that runs of
+different engine variants can be saved and compared.
+
+Usage examples:
+    python benchmark.py all --engine arrays --output arrays.json
+    python benchmark.py rollouts --game tensor
+    python benchmark.py iterations --iterations 20000
+    python benchmark.py latency --seconds 0.5
+    python benchmark.py tree-parallel --workers 1 2 4 8 --seconds 0.5 --games 20
+    python benchmark.py evaluator --batch-sizes 1 8 32 128
+    python benchmark.py solver --num-plays 20 26 32 --max-empty 12
+    python benchmark.py rollout-policies --policies random heavy '{"name": "truncated", "max_moves": 4}'
+    python benchmark.py branching --boards 6x7x4 9x9x5-free 15x15x5-free
+    python benchmark.py expansion --boards 6x7x4 15x15x5-free --widening 2 0.5
+    python benchmark.py startup --cases connect4 search-bitboard evaluator
+'''
+import argparse
+import collections
+import copy
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+import numpy as np
+
+from MCTS import MCTS, MCTS_Stats
+from connect4 import Connect_Four, Connect_Four_Bitboard
+from connect_n import Connect_N
+from match import ENGINES, OPENINGS, match_score, opening_position, seed_all
+from rollout_policies import POLICIES, make_policy
+
+GAMES = {'bitboard': Connect_Four_Bitboard, 'tensor': Connect_Four}
+
+def rollouts(game_class, seconds, batch_sizes=(64, 1024)):
+    '''Rollouts per second from the empty board, one game at a time with game.rollout, and with
+    batch_rollout for each of batch_sizes if the game has it.
+    '''
+    results = {}
+    game = game_class()
+    snapshot = game.snapshot()
+    count = 0
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < seconds:
+        game.restore(snapshot)
+        game.rollout()
+        count += 1
+    results['rollouts_per_second'] = count / (time.perf_counter() - start_time)
+    if hasattr(game_class, 'batch_rollout'):
+        for batch_size in batch_sizes:
+            snapshots = [snapshot] * batch_size
+            count = 0
+            start_time = time.perf_counter()
+            while time.perf_counter() - start_time < seconds:
+                game.batch_rollout(snapshots)
+                count += batch_size
+            results['batch_{}_rollouts_per_second'.format(batch_size)] = (
+                count / (time.perf_counter() - start_time))
+    return results
+
+def iterations(engine, game_class, num_iterations, seed=0):
+    '''Iterations per second of MCTS over OPENINGS, with the time split between the selection,
+    play, expansion, rollout and back propogation steps, and the mean depth of the leaves and
+    length of the rollouts (see MCTS_Stats). The timing adds some overhead, so
+    iterations_per_second is measured in a separate run without stats.
+    '''
+    totals = dict.fromkeys(MCTS_Stats.PHASES, 0)
+    depths = collections.Counter()
+    rollout_lengths = collections.Counter()
+    seconds = 0
+    for i, moves in enumerate(OPENINGS):
+        seed_all(seed + i)
+        search = engine(opening_position(moves, game_class), None, max_iterations=num_iterations)
+        start_time = time.perf_counter()
+        search.run_MCTS()
+        seconds += time.perf_counter() - start_time
+
+        seed_all(seed + i)
+        search = engine(opening_position(moves, game_class), None, max_iterations=num_iterations,
+                        collect_stats=True)
+        search.run_MCTS()
+        for phase, phase_seconds in search.stats.phase_seconds.items():
+            totals[phase] += phase_seconds
+        depths.update(search.stats.depth_histogram)
+        rollout_lengths.update(search.stats.rollout_lengths)
+    phase_total = sum(totals.values())
+    return {
+        'iterations_per_second': num_iterations * len(OPENINGS) / seconds,
+        'phase_fraction': {name: value / phase_total for name, value in totals.items()},
+        'mean_leaf_depth': sum(d * n for d, n in depths.items()) / sum(depths.values()),
+        'mean_rollout_length': (
+            sum(l * n for l, n in rollout_lengths.items()) / sum(rollout_lengths.values())),
+    }
+
+def latency(engine, game_class, seconds=None, num_iterations=None, seed=0):
+    '''Decision latency (wall time of run_MCTS) and peak memory allocated during the search, for
+    each position in OPENINGS. Memory is traced in a separate run, as tracing slows the search, and
+    counts every allocation traced by tracemalloc, not only the tree's.
+    '''
+    results = []
+    for i, moves in enumerate(OPENINGS):
+        settings = {'max_iterations': num_iterations}
+        seed_all(seed + i)
+        search = engine(opening_position(moves, game_class), seconds, **settings)
+        start_time = time.perf_counter()
+        action = search.run_MCTS()
+        decision_seconds = time.perf_counter() - start_time
+        iterations_run = search.iterations
+
+        seed_all(seed + i)
+        tracemalloc.start()
+        search = engine(opening_position(moves, game_class), seconds, **settings)
+        search.run_MCTS()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({
+            'opening': moves,
+            'action': int(action),
+            'decision_seconds': decision_seconds,
+            'iterations': iterations_run,
+            'nodes': search.node_count(),
+            'peak_traced_bytes': peak,
+        })
+    return results
+
+def policy_costs(spec, seconds):
+    '''Rollouts per second of a rollout policy over the positions in OPENINGS, and the mean number
+    of moves it plays per rollout.
+    '''
+    policy = make_policy(spec)
+    count = moves = 0
+    elapsed = 0
+    for opening in OPENINGS:
+        game = opening_position(opening)
+        snapshot = game.snapshot()
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < seconds / len(OPENINGS):
+            game.restore(snapshot)
+            policy.rollout(game)
+            moves += game.num_plays - len(opening)
+            count += 1
+        elapsed += time.perf_counter() - start_time
+    return {'rollouts_per_second': count / elapsed, 'mean_rollout_moves': moves / count}
+
+def rollout_policies(specs, seconds, num_iterations, games):
+    '''Cost and playing strength of each rollout policy in specs (see
+    rollout_policies.make_policy), measured against MCTS with uniform random rollouts: first with
+    the same number of iterations per move, which shows how much each rollout is worth, and then
+    with the same thinking time, which also accounts for the cost of the rollouts.
+    '''
+    results = []
+    for spec in specs:
+        result = {'rollout_policy': spec}
+        result.update(policy_costs(spec, seconds))
+        if games:
+            same_iterations = {'max_iterations': num_iterations}
+            result['score_same_iterations'] = match_score(
+                dict(same_iterations, rollout_policy=spec), same_iterations, None, games)
+            result['score_same_time'] = match_score({'rollout_policy': spec}, {}, seconds, games)
+        results.append(result)
+    return results
+
+def evaluator_batching(batch_sizes, num_iterations, seed=0):
+    '''Positions per second evaluated by the reference network (evaluator.Connect_Four_Net), and
+    iterations per second of MCTS using it, for each batch size. The network is only imported
+    here, so the other benchmarks do not need it.
+    '''
+    import torch
+    from evaluator import Batch_Evaluator, Connect_Four_Net
+    torch.manual_seed(seed)
+    net = Connect_Four_Net()
+    results = []
+    for batch_size in batch_sizes:
+        evaluator = Batch_Evaluator(net, batch_size=batch_size, timeout=0)
+        states = [evaluator.encode(opening_position(moves)) for moves in OPENINGS]
+        states = (states * (batch_size // len(states) + 1))[:batch_size]
+        count = 0
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < 1:
+            evaluator.evaluate(states)
+            count += batch_size
+        positions_per_second = count / (time.perf_counter() - start_time)
+
+        seconds = 0
+        for i, moves in enumerate(OPENINGS):
+            seed_all(seed + i)
+            search = MCTS(opening_position(moves), None, max_iterations=num_iterations,
+                          batch_size=batch_size, evaluator=evaluator)
+            start_time = time.perf_counter()
+            search.run_MCTS()
+            seconds += time.perf_counter() - start_time
+        results.append({
+            'batch_size': batch_size,
+            'positions_per_second': positions_per_second,
+            'iterations_per_second': num_iterations * len(OPENINGS) / seconds,
+        })
+    return results
+
+def endgame_positions(num_plays, count, seed=0):
+    '''Returns list of count games reached by random play to num_plays moves, where the game is
+    not over and the player to move has more than one choice.
+    '''
+    rng = random.Random(seed)
+    games = []
+    while len(games) < count:
+        game = Connect_Four_Bitboard()
+        while game.num_plays < num_plays and not game.game_over:
+            game.play(rng.choice(game.actions_available()))
+        if not game.game_over and len(game.actions_available()) > 1:
+            games.append(game)
+    return games
+
+def endgame_solver(num_plays_list, positions, num_iterations, max_empty, seed=0):
+    '''Decision latency and accuracy of MCTS with and without MCTS-Solver (with an
+    solver.Endgame_Solver for positions with at most max_empty empty cells), over positions
+    reached by random play to each number of moves. A move is counted as optimal if it keeps the
+    exact value of the position.
+    '''
+    from solver import Endgame_Solver
+    exact = Endgame_Solver(max_empty=42)
+    def value_after(game, action):
+        #value of playing action, for the player making it
+        game = copy.deepcopy(game)
+        game.play(action)
+        if game.game_over:
+            return 0 if np.isnan(game.winner) else 1
+        return -exact.solve(game)
+    results = []
+    for num_plays in num_plays_list:
+        games = endgame_positions(num_plays, positions, seed)
+        values = [exact.solve(game) for game in games]
+        for solver in (False, True):
+            settings = {'max_iterations': num_iterations}
+            if solver:
+                settings.update(solver=True, endgame_solver=Endgame_Solver(max_empty=max_empty))
+            seconds = iterations_run = optimal = 0
+            for i, (game, value) in enumerate(zip(games, values)):
+                seed_all(seed + i)
+                search = MCTS(game, None, **settings)
+                start_time = time.perf_counter()
+                action = search.run_MCTS()
+                seconds += time.perf_counter() - start_time
+                iterations_run += search.iterations
+                optimal += value_after(game, action) == value
+            results.append({
+                'num_plays': num_plays,
+                'solver': solver,
+                'mean_decision_seconds': seconds / len(games),
+                'mean_iterations': iterations_run / len(games),
+                'optimal_move_rate': optimal / len(games),
+            })
+    return results
+
+def tree_parallel(worker_counts, seconds, games):
+    '''Throughput and playing strength of tree-parallel MCTS for each number of worker threads,
+    relative to the single-threaded search with the same thinking time.
+    '''
+    results = []
+    for workers in worker_counts:
+        settings = {'num_threads': workers}
+        sims_per_second = []
+        for moves in OPENINGS:
+            search = MCTS(opening_position(moves), seconds, **settings)
+            search.run_MCTS()
+            sims_per_second.append(search.sims_per_second)
+        results.append({
+            'workers': workers,
+            'sims_per_second': float(np.mean(sims_per_second)),
+            'score_vs_single_thread': match_score(settings, {}, seconds, games) if games else None,
+        })
+    return results
+
+def branching(boards, seconds, num_iterations, seed=0):
+    '''Rollouts and MCTS iterations per second from the empty board of Connect_N games of each
+    size in boards (tuples of Connect_N arguments), to show how the engine scales as the
+    branching factor grows, with the mean depth of the leaves reached.
+    '''
+    results = []
+    for i, board in enumerate(boards):
+        game = Connect_N(*board)
+        rollout_results = rollouts(lambda: Connect_N(*board), seconds, batch_sizes=())
+        seed_all(seed + i)
+        search = MCTS(Connect_N(*board), None, max_iterations=num_iterations)
+        start_time = time.perf_counter()
+        search.run_MCTS()
+        search_seconds = time.perf_counter() - start_time
+        seed_all(seed + i)
+        search = MCTS(Connect_N(*board), None, max_iterations=num_iterations, collect_stats=True)
+        search.run_MCTS()
+        stats = search.stats.summary()
+        results.append({
+            'board': dict(zip(('num_rows', 'num_cols', 'connect', 'gravity'), board)),
+            'branching_factor': len(game.legal_actions()),
+            'rollouts_per_second': rollout_results['rollouts_per_second'],
+            'iterations_per_second': num_iterations / search_seconds,
+            'phase_fraction': stats['phase_fraction'],
+            'mean_leaf_depth': stats['mean_leaf_depth'],
+            'mean_rollout_length': stats['mean_rollout_length'],
+        })
+    return results
+
+def expansion(boards, num_iterations, widening, games, seconds, seed=0):
+    '''Cost of eager expansion (every child created when a node is expanded), lazy expansion and
+    lazy expansion with progressive widening (see the lazy_expansion and widening arguments of
+    MCTS), from the empty board of Connect_N games of each size in boards: iterations per second,
+    nodes in the tree, peak memory allocated during the search (traced in a separate run), and
+    seconds spent selecting per iteration. With games, each lazy variant also plays connect four
+    against eager expansion, with seconds per move.
+    '''
+    modes = {'eager': {}, 'lazy': {'lazy_expansion': True}, 'widening': {'widening': widening}}
+    results = {}
+    for name, settings in modes.items():
+        mode_results = []
+        for i, board in enumerate(boards):
+            seed_all(seed + i)
+            search = MCTS(Connect_N(*board), None, max_iterations=num_iterations, **settings)
+            start_time = time.perf_counter()
+            search.run_MCTS()
+            search_seconds = time.perf_counter() - start_time
+
+            seed_all(seed + i)
+            tracemalloc.start()
+            MCTS(Connect_N(*board), None, max_iterations=num_iterations, **settings).run_MCTS()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            seed_all(seed + i)
+            stats_search = MCTS(Connect_N(*board), None, max_iterations=num_iterations,
+                                collect_stats=True, **settings)
+            stats_search.run_MCTS()
+            mode_results.append({
+                'board': dict(zip(('num_rows', 'num_cols', 'connect', 'gravity'), board)),
+                'iterations_per_second': num_iterations / search_seconds,
+                'nodes': search.node_count(),
+                'peak_traced_bytes': peak,
+                'select_seconds_per_iteration': (
+                    stats_search.stats.phase_seconds['select'] / num_iterations),
+                'mean_leaf_depth': stats_search.stats.summary()['mean_leaf_depth'],
+            })
+        results[name] = {'settings': settings, 'boards': mode_results}
+        if games and settings:
+            results[name]['connect_four_score_vs_eager'] = match_score(settings, {}, seconds, games)
+    return results
+
+#code run in a fresh interpreter by 'startup': the imports are timed, then the code run after them
+_STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+{imports}
+import_seconds = time.perf_counter() - start
+def peak_rss(pid='self'):
+    #VmHWM rather than ru_maxrss, which on Linux includes the peak of the parent process
+    try:
+        with open('/proc/{{}}/status'.format(pid)) as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) / 2**10
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError: #not available on Windows
+        return None
+    if pid != 'self':
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10 #bytes on macOS, else KiB
+import_rss = peak_rss()
+{run}
+print(json.dumps({{'import_seconds': import_seconds, 'import_rss_mb': import_rss,
+                  'run_rss_mb': peak_rss(), 'worker_rss_mb': worker_rss_mb,
+                  'torch_loaded': 'torch' in sys.modules}}))
+'''
+
+STARTUP_CASES = {
+    'python': ('', ''),
+    'connect4': ('import connect4', ''),
+    'search-bitboard': ('from MCTS import MCTS\nfrom connect4 import Connect_Four_Bitboard',
+                        'MCTS(Connect_Four_Bitboard(), None, max_iterations={iterations}).run_MCTS()'),
+    'search-tensor': ('from MCTS import MCTS\nfrom connect4 import Connect_Four',
+                      'MCTS(Connect_Four(), None, max_iterations={iterations}).run_MCTS()'),
+    'engine': ('import engine', ''),
+    #a pool worker's own peak memory, after its share of a root-parallel search
+    'pool-worker': ('import os\nfrom MCTS import MCTS, make_pool\n'
+                    'from connect4 import Connect_Four_Bitboard',
+                    'pool = make_pool(1)\n'
+                    'MCTS(Connect_Four_Bitboard(), None, max_iterations={iterations}, pool=pool).run_MCTS()\n'
+                    'worker_rss_mb = peak_rss(pool.submit(os.getpid).result())\npool.shutdown()'),
+    'evaluator': ('from MCTS import MCTS\nfrom connect4 import Connect_Four_Bitboard\n'
+                  'from evaluator import Batch_Evaluator, Connect_Four_Net',
+                  'MCTS(Connect_Four_Bitboard(), None, max_iterations={iterations}, batch_size=8, '
+                  'evaluator=Batch_Evaluator(Connect_Four_Net(), batch_size=8)).run_MCTS()'),
+}
+
+def startup(cases, num_iterations, repeats):
+    '''Startup time and memory of a fresh process for each case in STARTUP_CASES: the time taken
+    by its imports and by the whole process (interpreter startup included), its peak resident
+    memory after the imports and after a search of num_iterations iterations, and whether torch
+    was imported. Each case is run repeats times, and the median times reported. Peak memory is
+    not available on Windows, nor for pool workers other than on Linux.
+    '''
+    import statistics
+    import subprocess
+    import sys
+    results = []
+    for name in cases:
+        imports, run = STARTUP_CASES[name]
+        script = _STARTUP_SCRIPT.format(
+            imports=imports, run='worker_rss_mb = None\n' + run.format(iterations=num_iterations))
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+            process_seconds = time.perf_counter() - start
+            if process.returncode != 0:
+                runs = None
+                error = process.stderr.strip().splitlines()[-1]
+                break
+            runs.append(dict(json.loads(process.stdout.splitlines()[-1]),
+                             process_seconds=process_seconds))
+        if runs is None:
+            results.append({'case': name, 'error': error})
+            continue
+        result = {'case': name}
+        for key in ('import_seconds', 'process_seconds'):
+            result[key] = statistics.median(run[key] for run in runs)
+        for key in ('import_rss_mb', 'run_rss_mb', 'worker_rss_mb', 'torch_loaded'):
+            result[key] = runs[-1][key]
+        results.append(result)
+    return results
+
+def parse_board(text):
+    '''Parses a Connect_N board command line argument: rows x columns x connect, with -free
+    for pieces placed anywhere rather than dropped, e.g. 6x7x4 or 15x15x5-free.
+    '''
+    free = text.endswith('-free')
+    num_rows, num_cols, connect = (int(n) for n in text.replace('-free', '').split('x'))
+    return (num_rows, num_cols, connect, not free)
+
+def parse_policy(text):
+    '''Parses a rollout policy command line argument: a name, or a JSON dict.'''
+    return json.loads(text) if text.startswith('{') else text
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output', help='file to write the JSON results to, as well as stdout')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_engine_arguments(command):
+        command.add_argument('--engine', choices=ENGINES, default='nodes')
+        command.add_argument('--game', choices=GAMES, default='bitboard')
+
+    command = commands.add_parser('all', help='rollouts, iterations and latency together', parents=[common])
+    add_engine_arguments(command)
+    command.add_argument('--iterations', type=int, default=5000, help='iterations per search')
+
+    command = commands.add_parser('rollouts', help='rollouts per second', parents=[common])
+    command.add_argument('--game', choices=GAMES, default='bitboard')
+    command.add_argument('--seconds', type=float, default=2, help='time per measurement')
+
+    command = commands.add_parser('iterations', help='MCTS iterations per second, by phase', parents=[common])
+    add_engine_arguments(command)
+    command.add_argument('--iterations', type=int, default=5000, help='iterations per search')
+
+    command = commands.add_parser('latency', help='decision latency and peak traced memory', parents=[common])
+    add_engine_arguments(command)
+    budget = command.add_mutually_exclusive_group()
+    budget.add_argument('--seconds', type=float, help='thinking time per move')
+    budget.add_argument('--iterations', type=int, default=5000, help='iterations per move')
+
+    command = commands.add_parser('tree-parallel', help='scaling of tree-parallel MCTS', parents=[common])
+    command.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    command.add_argument('--seconds', type=float, default=0.5, help='thinking time per move')
+    command.add_argument('--games', type=int, default=20, help='games vs single thread per count')
+
+    command = commands.add_parser('rollout-policies', help='cost and strength of rollout policies',
+                                  parents=[common])
+    command.add_argument('--policies', type=parse_policy, nargs='+',
+                         default=['random'] + [name for name in POLICIES if name != 'random'],
+                         help='policy names, or JSON such as \'{"name": "truncated", "heavy": true}\'')
+    command.add_argument('--seconds', type=float, default=0.5,
+                         help='thinking time per move, and time per cost measurement')
+    command.add_argument('--iterations', type=int, default=1000, help='iterations per move')
+    command.add_argument('--games', type=int, default=20, help='games vs random rollouts per policy')
+
+    command = commands.add_parser('evaluator', help='batched network evaluation throughput',
+                                  parents=[common])
+    command.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    command.add_argument('--iterations', type=int, default=2000, help='iterations per search')
+
+    command = commands.add_parser('solver', help='endgame latency with and without the solver',
+                                  parents=[common])
+    command.add_argument('--num-plays', type=int, nargs='+', default=[20, 26, 32],
+                         help='moves played before the positions searched')
+    command.add_argument('--positions', type=int, default=20, help='positions per number of moves')
+    command.add_argument('--iterations', type=int, default=5000, help='iterations per search')
+    command.add_argument('--max-empty', type=int, default=12,
+                         help='empty cells at which the endgame solver takes over')
+
+    command = commands.add_parser('branching', help='scaling with the branching factor',
+                                  parents=[common])
+    command.add_argument('--boards', type=parse_board, nargs='+',
+                         default=[parse_board(board) for board in (
+                             '6x7x4', '8x10x4', '10x14x5', '3x3x3-free', '7x7x4-free',
+                             '9x9x5-free', '15x15x5-free')],
+                         help='Connect_N boards as rows x columns x connect, e.g. 9x9x5-free')
+    command.add_argument('--seconds', type=float, default=1, help='time per rollout measurement')
+    command.add_argument('--iterations', type=int, default=3000, help='iterations per search')
+
+    command = commands.add_parser('expansion', help='eager vs lazy expansion and widening',
+                                  parents=[common])
+    command.add_argument('--boards', type=parse_board, nargs='+',
+                         default=[parse_board(board) for board in (
+                             '6x7x4', '10x14x5', '9x9x5-free', '15x15x5-free')],
+                         help='Connect_N boards as rows x columns x connect, e.g. 9x9x5-free')
+    command.add_argument('--iterations', type=int, default=3000, help='iterations per search')
+    command.add_argument('--widening', type=float, nargs=2, default=[2, 0.5],
+                         metavar=('CONSTANT', 'EXPONENT'), help='progressive widening settings')
+    command.add_argument('--games', type=int, default=0,
+                         help='connect four games vs eager expansion per lazy variant')
+    command.add_argument('--seconds', type=float, default=0.2, help='thinking time per move')
+
+    command = commands.add_parser('startup', help='import time and memory of fresh processes',
+                                  parents=[common])
+    command.add_argument('--cases', nargs='+', choices=STARTUP_CASES, default=list(STARTUP_CASES))
+    command.add_argument('--iterations', type=int, default=2000, help='iterations per search')
+    command.add_argument('--repeats', type=int, default=3, help='processes per case')
+
+    args = parser.parse_args()
+    results = {'command': args.command, 'python': platform.python_version()}
+    for name in ('engine', 'game'):
+        if hasattr(args, name):
+            results[name] = getattr(args, name)
+    engine = ENGINES.get(getattr(args, 'engine', None))
+    game_class = GAMES.get(getattr(args, 'game', None))
+    if args.command in ('all', 'rollouts'):
+        results['rollouts'] = rollouts(game_class, getattr(args, 'seconds', 2))
+    if args.command in ('all', 'iterations'):
+        results['iterations'] = iterations(engine, game_class, args.iterations)
+    if args.command in ('all', 'latency'):
+        if getattr(args, 'seconds', None) is not None:
+            results['latency'] = latency(engine, game_class, seconds=args.seconds)
+        else:
+            results['latency'] = latency(engine, game_class, num_iterations=args.iterations)
+    if args.command == 'rollout-policies':
+        results['rollout_policies'] = rollout_policies(
+            args.policies, args.seconds, args.iterations, args.games)
+    if args.command == 'evaluator':
+        results['evaluator'] = evaluator_batching(args.batch_sizes, args.iterations)
+    if args.command == 'solver':
+        results['solver'] = endgame_solver(args.num_plays, args.positions, args.iterations,
+                                           args.max_empty)
+    if args.command == 'expansion':
+        results['expansion'] = expansion(args.boards, args.iterations, tuple(args.widening),
+                                         args.games, args.seconds)
+    if args.command == 'branching':
+        results['branching'] = branching(args.boards, args.seconds, args.iterations)
+    if args.command == 'startup':
+        results['startup'] = startup(args.cases, args.iterations, args.repeats)
+    if args.command == 'tree-parallel':
+        results['tree_parallel'] = tree_parallel(args.workers, args.seconds, args.games)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,16 @@
 import random
-import torch
 import numpy as np
 
-class Connect_Four():
-    '''Instances are a particular game of connect four.
+from game import Game
+
+#random 64-bit keys for Zobrist hashing, indexed by [player][col * 7 + row] with row 0 being the
+#bottom row. The seed is fixed so that hashes agree between processes and between runs.
+_zobrist_random = random.Random(0)
+_ZOBRIST = [[_zobrist_random.getrandbits(64) for _ in range(7 * 7)] for _ in range(2)]
+
+class Connect_Four(Game):
+    '''Instances are a particular game of connect four, implementing the game protocol (see
+    game.Game) with column indices as actions.
     
     Attributes:
         num_rows, num_cols:
@@ -16,7 +23,7 @@ class Connect_Four():
         game_over:
             boolean - whether the game is over
         winner:
-            int - np.nan (pytorch does not handle None well), if game is not
+            int - np.nan (so that it can be stored in arrays), if game is not
             over or game is over and a tie, otherwise indicates winner (player
             0 or 1)
         player_turn:
@@ -28,18 +35,25 @@ class Connect_Four():
         num_plays:
             int - total number of turns taken so far (i.e., number of pieces
             on the board)
+        position_hash:
+            int - Zobrist hash of the position, updated incrementally in play
+        num_actions, legal_mask:
+            as for game.Game
     '''
+    num_actions = 7
+
     def __init__(self):
         self.num_rows = 6
         self.num_cols = 7
-        self.board = torch.zeros([self.num_rows,self.num_cols]).long()
-        self.column_heights = torch.zeros(self.num_cols).long()
+        self.board = np.zeros([self.num_rows,self.num_cols], dtype=np.int64)
+        self.column_heights = np.zeros(self.num_cols, dtype=np.int64)
         self.game_over = False
         self.winner = np.nan
         self.player_turn = 0
         self.print_game = False
         self.last_actions = [None, None]
         self.num_plays = 0
+        self.position_hash = 0
     
     def reset(self):
         '''Reset the game to beginning.'''
@@ -84,7 +98,7 @@ class Connect_Four():
         def check_axis(row, col, row_incr, col_incr, board):
             '''Checks for winning connections of 4 starting from the piece at
             (row, col), but only along the axis specified by row_incr,
-            col_incr. Board is a tensor, others are ints.
+            col_incr. Board is a numpy array, others are ints.
             '''
             player_num = board[row,col].item()
             counter = 1
@@ -121,7 +135,7 @@ class Connect_Four():
                     self.game_over = True
                     return player-1
             #board full
-            if torch.sum(self.column_heights == self.num_rows) == self.num_cols and np.isnan(self.winner):
+            if np.sum(self.column_heights == self.num_rows) == self.num_cols and np.isnan(self.winner):
                 self.game_over = True
                 return np.nan
         return np.nan # game not over
@@ -133,6 +147,8 @@ class Connect_Four():
         if action < 0 or action >= self.num_cols:
             raise Exception('invalid action: {}'.format(action))
         if self.column_heights[action] < self.num_rows:
+            self.position_hash ^= _ZOBRIST[self.player_turn][
+                action * 7 + self.column_heights[action].item()]
             self.board[(self.num_rows-1) - self.column_heights[action]][action] = self.player_turn + 1
             self.column_heights[action] += 1
             self.last_actions[self.player_turn] = action
@@ -140,23 +156,56 @@ class Connect_Four():
         else:
             raise Exception("Board space already occupied")
         #switch who's turn it is from 1 -> 0 or 0 -> 1
-        self.player_turn = 1-self.player_turn 
+        self.player_turn = 1-self.player_turn
         self.winner = self.check_win()
-    
+
+    def undo(self, action):
+        '''Takes back the piece played in column action, which must be the last one played.
+        last_actions for the player who played it becomes None.
+        '''
+        self.player_turn = 1-self.player_turn
+        self.column_heights[action] -= 1
+        height = self.column_heights[action].item()
+        self.board[(self.num_rows-1) - height][action] = 0
+        self.position_hash ^= _ZOBRIST[self.player_turn][action * 7 + height]
+        self.last_actions[self.player_turn] = None
+        self.num_plays -= 1
+        self.game_over = False
+        self.winner = np.nan
+
+    @property
+    def legal_mask(self):
+        '''Bitmask of the columns that are not full (see game.Game).'''
+        return sum(1 << col for col, height in enumerate(self.column_heights.tolist())
+                   if height < self.num_rows)
+
+    def legal_actions(self):
+        '''Returns list of column indices in which a legal move may be played.'''
+        if self.game_over:
+            return []
+        return [col for col, height in enumerate(self.column_heights.tolist())
+                if height < self.num_rows]
+
     def actions_available(self, boolean_out=False):
-        '''Returns tensor of column indices in which a legal move may be
-        played. Alternatively returns 0/1 boolean mask over columns if
+        '''Returns numpy array of column indices in which a legal move may be
+        played. Alternatively returns boolean mask over columns if
         boolean_out = True.
         '''
         if boolean_out:
-            return (self.column_heights<self.num_rows).bool()
+            return self.column_heights<self.num_rows
         else:
             if self.game_over:
-                return torch.tensor([])
+                return np.array([], dtype=np.int64)
             else:
-                return torch.arange(self.num_cols)[
+                return np.arange(self.num_cols)[
                     (self.column_heights<self.num_rows)]
-    
+
+    def cells(self):
+        '''Returns the board as a list of rows of ints (0 for empty, 1 or 2 for each player's
+        pieces), with row 0 the top row.
+        '''
+        return self.board.tolist()
+
     def print_board(self):
         '''Output the current board state to console'''
         print(self.board)
@@ -165,6 +214,394 @@ class Connect_Four():
     def set_print_game(self, boolean):
         self.print_game = boolean
     
+    def snapshot(self):
+        '''Returns a tuple holding the full game state, for passing to restore later. The board
+        arrays are copied, so the snapshot is unaffected by subsequent plays.
+        '''
+        return (self.board.copy(), self.column_heights.copy(), self.game_over, self.winner,
+                self.player_turn, tuple(self.last_actions), self.num_plays, self.position_hash)
+    
+    def restore(self, snapshot):
+        '''Return the game to the state captured by snapshot. Copies into the existing arrays
+        rather than allocating new ones.
+        '''
+        board, column_heights, self.game_over, self.winner, self.player_turn, last_actions, \
+            self.num_plays, self.position_hash = snapshot
+        self.board[...] = board
+        self.column_heights[...] = column_heights
+        self.last_actions[0], self.last_actions[1] = last_actions
+    
+    def get_hash(self):
+        '''Returns the Zobrist hash (int) of the current position.'''
+        return self.position_hash
+    
+    def hash_after(self, action):
+        '''Returns the hash the position would have after the current player plays in column
+        action, without playing it.
+        '''
+        return self.position_hash ^ _ZOBRIST[self.player_turn][
+            action * 7 + self.column_heights[action].item()]
+    
     def get_state(self):
-        '''Returns tuple of board (2d tensor) and turn (int)'''
-        return (self.board, self.player_turn)
\ No newline at end of file
+        '''Returns tuple of board (2d tensor) and turn (int). torch is only imported here, so
+        that the game itself does not need it (it is installed by requirements-evaluator.txt).
+        '''
+        import torch
+        return (torch.from_numpy(self.board), self.player_turn)
+
+#bit layout for Connect_Four_Bitboard: each column uses _HEIGHT bits, bottom row first, with one
+#spare bit on top of every column so that shifted masks never wrap from one column into the next
+_HEIGHT = 7
+_FULL_PLAYS = 42
+_ALL_COLUMNS = 0b1111111
+#_LEGAL_COLUMNS[mask] is a tuple of the columns whose bit is set in the 7-bit mask
+_LEGAL_COLUMNS = tuple(
+    tuple(col for col in range(7) if mask >> col & 1) for mask in range(1 << 7)
+)
+
+#bits of the 6 playable rows of every column, and of the bottom row of every column
+_BOARD_MASK = sum(((1 << 6) - 1) << (col * _HEIGHT) for col in range(7))
+_BOTTOM_MASK = sum(1 << (col * _HEIGHT) for col in range(7))
+
+def _playable_cells(filled):
+    '''Returns bitboard of the cells a piece can be played in next (the lowest empty cell of every
+    column that is not full), given the bitboard of all filled cells.
+    '''
+    return (filled + _BOTTOM_MASK) & _BOARD_MASK
+
+def _winning_cells(bitboard, filled):
+    '''Returns bitboard of the empty cells (playable now or not) that would complete 4 in a row
+    for the player whose pieces are in bitboard, given the bitboard of all filled cells.
+
+    For each axis (as in _is_four), a cell wins if it is at one end of three in a row, or fills
+    the gap in a row of four. Written out in full rather than looping over the axes, as heavy
+    rollouts call it for every move.
+    '''
+    b = bitboard
+    cells = (b << 1) & (b << 2) & (b << 3) #vertical: only from above
+    pair = (b << 7) & (b << 14)
+    cells |= pair & ((b << 21) | (b >> 7))
+    pair = (b >> 7) & (b >> 14)
+    cells |= pair & ((b >> 21) | (b << 7))
+    pair = (b << 6) & (b << 12)
+    cells |= pair & ((b << 18) | (b >> 6))
+    pair = (b >> 6) & (b >> 12)
+    cells |= pair & ((b >> 18) | (b << 6))
+    pair = (b << 8) & (b << 16)
+    cells |= pair & ((b << 24) | (b >> 8))
+    pair = (b >> 8) & (b >> 16)
+    cells |= pair & ((b >> 24) | (b << 8))
+    return cells & (_BOARD_MASK ^ filled)
+
+def _zobrist_hash(bitboards):
+    '''Returns the Zobrist hash of the position held in a pair of bitboards, computed from scratch.'''
+    position_hash = 0
+    for player in (0, 1):
+        bitboard = bitboards[player]
+        while bitboard:
+            bit = bitboard & -bitboard
+            position_hash ^= _ZOBRIST[player][bit.bit_length() - 1]
+            bitboard ^= bit
+    return position_hash
+
+def _is_four(bitboard):
+    '''Returns True if the bitboard contains 4 pieces in a row along any axis.
+
+    Shifting by 1 checks vertical, by _HEIGHT horizontal, and by _HEIGHT -/+ 1 the two diagonals.
+    '''
+    for shift in (1, _HEIGHT, _HEIGHT - 1, _HEIGHT + 1):
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+class Connect_Four_Bitboard(Game):
+    '''Connect four with the same public interface as Connect_Four, but with the board held as two
+    64-bit integer masks (one per player) rather than an array. Intended as a drop-in replacement
+    wherever the game is played many times, e.g. the rollouts in MCTS.
+
+    Attributes:
+        num_rows, num_cols:
+            Int - Dimensions of the board
+        bitboards:
+            list of 2 ints - bit (col * 7 + row) is set where that player has a piece, with row 0
+            being the bottom row.
+        column_heights:
+            list of ints - number of pieces in a particular column
+        legal_mask:
+            int - bit col is set if a piece may still be played in column col
+        position_hash:
+            int - Zobrist hash of the position, updated incrementally in play. rollout does not
+            update it and sets it to None instead; use get_hash, which recomputes it if needed.
+        game_over, winner, player_turn, print_game, last_actions, num_plays, num_actions:
+            as for Connect_Four
+    '''
+    num_actions = 7
+
+    def __init__(self):
+        self.num_rows = 6
+        self.num_cols = 7
+        self.bitboards = [0, 0]
+        self.column_heights = [0] * self.num_cols
+        self.legal_mask = _ALL_COLUMNS
+        self.game_over = False
+        self.winner = np.nan
+        self.player_turn = 0
+        self.print_game = False
+        self.last_actions = [None, None]
+        self.num_plays = 0
+        self.position_hash = 0
+
+    @property
+    def board(self):
+        '''numpy array of the board, matching Connect_Four.board (row 0 is the top row).'''
+        return np.array(self.cells(), dtype=np.int64)
+
+    def cells(self):
+        '''Returns the board as a list of rows of ints (0 for empty, 1 or 2 for each player's
+        pieces), with row 0 the top row, as in 'board' but without building an array.
+        '''
+        rows = [[0] * self.num_cols for _ in range(self.num_rows)]
+        for player in (0, 1):
+            bitboard = self.bitboards[player]
+            for col in range(self.num_cols):
+                for row in range(self.column_heights[col]):
+                    if bitboard >> (col * _HEIGHT + row) & 1:
+                        rows[(self.num_rows-1) - row][col] = player + 1
+        return rows
+
+    def reset(self):
+        '''Reset the game to beginning.'''
+        self.__init__()
+
+    def get_reward(self):
+        '''Return tuple of rewards associated w/ current game state for
+        players (0, 1) respectively.
+        '''
+        if self.game_over:
+            if self.winner == 0:
+                return (1,-1)
+            elif self.winner == 1:
+                return (-1,1)
+            else:
+                return (0,0) #draw
+        return (0,0) #game not done
+
+    def random_move(self, player_num):
+        '''Player indicated by player_num takes action at random.'''
+        rand_action = random.choice(_LEGAL_COLUMNS[self.legal_mask])
+        self.play(rand_action)
+        if self.print_game: print("player ", player_num, " played ", rand_action)
+
+    def rollout(self):
+        '''Plays out the rest of the game according to the rollout policy (currently random moves by
+        both players).
+
+        The moves are made directly on local copies of the bitboards rather than through play, as
+        this loop is where nearly all of the time in MCTS is spent.
+        '''
+        if self.print_game:
+            while not self.game_over:
+                self.random_move(self.player_turn)
+            return
+        if self.game_over:
+            return
+        bitboards = self.bitboards
+        heights = self.column_heights
+        legal_mask = self.legal_mask
+        player = self.player_turn
+        num_plays = self.num_plays
+        choice = random.choice
+        action = None
+        while True:
+            prev_action = action
+            action = choice(_LEGAL_COLUMNS[legal_mask])
+            height = heights[action]
+            bitboard = bitboards[player] | (1 << (action * _HEIGHT + height))
+            bitboards[player] = bitboard
+            heights[action] = height + 1
+            if height == 5:
+                legal_mask &= ~(1 << action)
+            num_plays += 1
+            player = 1 - player
+            if num_plays >= 7 and _is_four(bitboard):
+                self.winner = 1 - player
+                break
+            if num_plays == _FULL_PLAYS:
+                break
+        self.last_actions[1 - player] = action
+        if prev_action is not None:
+            self.last_actions[player] = prev_action
+        self.legal_mask = legal_mask
+        self.player_turn = player
+        self.num_plays = num_plays
+        self.position_hash = None
+        self.game_over = True
+
+    @staticmethod
+    def batch_rollout(snapshots):
+        '''Plays out every game captured in snapshots (see snapshot) to completion in lockstep,
+        using numpy array operations rather than one python loop per game. Both players move
+        uniformly at random, as in rollout.
+
+        Arguments:
+            snapshots:
+                list of tuples returned by snapshot. Games that are already over are left as is.
+
+        Returns numpy array of shape (len(snapshots), 2) - rewards for players (0, 1) in each game.
+        '''
+        num_games = len(snapshots)
+        boards = np.zeros((num_games, 2), dtype=np.uint64)
+        heights = np.zeros((num_games, 7), dtype=np.int64)
+        player = np.zeros(num_games, dtype=np.int64)
+        num_plays = np.zeros(num_games, dtype=np.int64)
+        winner = np.full(num_games, -1)
+        done = np.zeros(num_games, dtype=bool)
+        for i, (bitboard_0, bitboard_1, column_heights, _, game_over, game_winner, player_turn,
+                _, _, plays, _) in enumerate(snapshots):
+            boards[i] = (bitboard_0, bitboard_1)
+            heights[i] = column_heights
+            player[i] = player_turn
+            num_plays[i] = plays
+            done[i] = game_over
+            if game_over and not np.isnan(game_winner):
+                winner[i] = game_winner
+
+        shifts = [(np.uint64(shift), np.uint64(2 * shift))
+                  for shift in (1, _HEIGHT, _HEIGHT - 1, _HEIGHT + 1)]
+        one = np.uint64(1)
+        active = np.flatnonzero(~done)
+        while active.size:
+            #pick a legal column uniformly: the pick-th open column, found via a cumulative sum
+            open_cols = np.cumsum(heights[active] < 6, axis=1)
+            pick = (np.random.random(active.size) * open_cols[:, -1]).astype(np.int64)
+            cols = np.argmax(open_cols > pick[:, None], axis=1)
+            rows = heights[active, cols]
+            heights[active, cols] = rows + 1
+            movers = player[active]
+            bitboard = boards[active, movers] | (one << (cols * _HEIGHT + rows).astype(np.uint64))
+            boards[active, movers] = bitboard
+            player[active] = 1 - movers
+            num_plays[active] += 1
+
+            won = np.zeros(active.size, dtype=bool)
+            for shift, double_shift in shifts:
+                pairs = bitboard & (bitboard >> shift)
+                won |= (pairs & (pairs >> double_shift)) != 0
+            winner[active[won]] = movers[won]
+            active = active[~(won | (num_plays[active] == _FULL_PLAYS))]
+
+        rewards = np.zeros((num_games, 2), dtype=np.int64)
+        rewards[winner == 0] = (1, -1)
+        rewards[winner == 1] = (-1, 1)
+        return rewards
+
+    def check_win(self):
+        '''Returns np.nan if no players has won, otherwise returns player number of winner. Sets
+        game_over if the last piece played won the game or filled the board.
+        '''
+        if self.num_plays < 7: #the earliest a player can win is on the first mover's 4th move, i.e. turn 7
+            return np.nan
+        player = 1 - self.player_turn
+        if _is_four(self.bitboards[player]):
+            self.game_over = True
+            return player
+        if self.num_plays == _FULL_PLAYS:
+            self.game_over = True
+        return np.nan
+
+    def play(self, action):
+        '''Play a piece for current player in column 'action'. Also change player_turn and check
+        for a winner.
+        '''
+        action = int(action)
+        if action < 0 or action >= self.num_cols:
+            raise Exception('invalid action: {}'.format(action))
+        height = self.column_heights[action]
+        if height >= self.num_rows:
+            raise Exception("Board space already occupied")
+        self.position_hash = self.get_hash() ^ _ZOBRIST[self.player_turn][action * _HEIGHT + height]
+        self.bitboards[self.player_turn] |= 1 << (action * _HEIGHT + height)
+        self.column_heights[action] = height + 1
+        if height + 1 == self.num_rows:
+            self.legal_mask &= ~(1 << action)
+        self.last_actions[self.player_turn] = action
+        self.num_plays += 1
+        #switch who's turn it is from 1 -> 0 or 0 -> 1
+        self.player_turn = 1-self.player_turn
+        self.winner = self.check_win()
+
+    def undo(self, action):
+        '''Takes back the piece played in column action, which must be the last one played.
+        last_actions for the player who played it becomes None.
+        '''
+        self.player_turn = 1-self.player_turn
+        height = self.column_heights[action] - 1
+        self.position_hash = self.get_hash() ^ _ZOBRIST[self.player_turn][action * _HEIGHT + height]
+        self.bitboards[self.player_turn] ^= 1 << (action * _HEIGHT + height)
+        self.column_heights[action] = height
+        self.legal_mask |= 1 << action
+        self.last_actions[self.player_turn] = None
+        self.num_plays -= 1
+        self.game_over = False
+        self.winner = np.nan
+
+    def legal_actions(self):
+        '''Returns tuple of column indices in which a legal move may be played.'''
+        if self.game_over:
+            return ()
+        return _LEGAL_COLUMNS[self.legal_mask]
+
+    def actions_available(self, boolean_out=False):
+        '''Returns numpy array of column indices in which a legal move may
+        be played. Alternatively returns boolean mask over columns if
+        boolean_out = True.
+        '''
+        if boolean_out:
+            return np.array([self.legal_mask >> col & 1 for col in range(self.num_cols)], dtype=bool)
+        else:
+            if self.game_over:
+                return np.array([], dtype=np.int64)
+            else:
+                return np.array(_LEGAL_COLUMNS[self.legal_mask], dtype=np.int64)
+
+    def print_board(self):
+        '''Output the current board state to console'''
+        print(self.board)
+        print("last action was: ", self.last_actions[1-self.player_turn])
+
+    def set_print_game(self, boolean):
+        self.print_game = boolean
+
+    def snapshot(self):
+        '''Returns an immutable tuple holding the full game state, for passing to restore later.'''
+        return (self.bitboards[0], self.bitboards[1], tuple(self.column_heights), self.legal_mask,
+                self.game_over, self.winner, self.player_turn, self.last_actions[0],
+                self.last_actions[1], self.num_plays, self.position_hash)
+
+    def restore(self, snapshot):
+        '''Return the game to the state captured by snapshot, reusing the existing lists.'''
+        (self.bitboards[0], self.bitboards[1], column_heights, self.legal_mask, self.game_over,
+         self.winner, self.player_turn, self.last_actions[0], self.last_actions[1],
+         self.num_plays, self.position_hash) = snapshot
+        self.column_heights[:] = column_heights
+
+    def get_hash(self):
+        '''Returns the Zobrist hash (int) of the current position.'''
+        if self.position_hash is None:
+            self.position_hash = _zobrist_hash(self.bitboards)
+        return self.position_hash
+
+    def hash_after(self, action):
+        '''Returns the hash the position would have after the current player plays in column
+        action, without playing it.
+        '''
+        return self.get_hash() ^ _ZOBRIST[self.player_turn][
+            action * _HEIGHT + self.column_heights[action]]
+
+    def get_state(self):
+        '''Returns tuple of board (2d tensor) and turn (int), as Connect_Four.get_state (which
+        needs torch, see requirements-evaluator.txt).
+        '''
+        import torch
+        return (torch.from_numpy(self.board), self.player_turn)
@@ -1,104 +1,297 @@
 import curses
-import torch
+import threading
 import time
 from MCTS import MCTS
-from connect4 import Connect_Four
-
-def print_board(board, w, char_dict={0:' ', 1:'X', 2:'0'}, winner=None):
-    '''Displays an ASCII connect 4 board in the terminal.
-    Parameters:
-        Board - torch.tensor
-            Holds numeric indication of where each player's pieces are (0,1,2)
-        w - curses window
-        char_dict - Dictionary
-            Maps each numeric entry in board to a character to display
+from connect4 import Connect_Four_Bitboard
+
+REFRESH_MS = 100 #how often the board and search stats are redrawn while waiting for input or the AI
+PONDER_NODES = 250000 #number of nodes a pondering search may add to its tree
+
+class Board_View():
+    '''Displays an ASCII connect 4 board in a curses window, with the border drawn once and only
+    the cells that changed since the last call to 'draw' written again.
+
+    Arguments:
+        w:
+            curses window
+        rows, cols:
+            ints - size of the board
+        char_dict:
+            dict - maps each numeric entry in the board to a character to display
+
+    Attributes:
+        top, left:
+            ints - window coordinates of the top left cell of the board
+        drawn:
+            list of lists of ints - the cells as last drawn, or None if the board must be drawn
+            from scratch
     '''
-    if type(board) != type(torch.tensor([])):
-        raise Exception('passed board for show method must be torch.tensor'
-                        'object.')
-    w.clear()
-    #midpoints of window
-    midy = sh // 2
-    midx = sw // 2
-
-    rows = board.shape[0]
-    cols = board.shape[1]
-
-    # draw pieces
-    for i, row in enumerate(board):
-        for j, val in enumerate(row):
-            x = midx - cols//2 + j
-            y = midy - rows//2 + i
-            w.addch(y, x, char_dict[int(val.item())])
-
-    # draw border
-    vpad, hpad = 1, 1 #number of spaces to leave btwn board and border
-    vbord, hbord =  curses.ACS_VLINE, curses.ACS_HLINE #chars to use for vertical/horizontal borders
-    bordw = cols + hpad*2 #border width
-    bordh = rows + vpad*2 #border height
-    
-    #top and bottom
-    for i in range(bordw):
-        w.addch(midy - rows//2 - hpad, midx - cols//2 - hpad + i, hbord)
-        w.addch(midy + rows//2 + hpad -1, midx - cols//2 - hpad + i, hbord)
-    
-    #column numbers
-    for i in range(cols):
-        w.addch(midy + rows//2 + 1, midx - cols//2 + i, str(i+1))
-    
-    #sides
-    for i in range(bordh):
-        w.addch(midy - rows//2 - vpad + i, midx - cols//2 - vpad, vbord)
-        w.addch(midy - rows//2 - vpad + i, midx + cols//2 + vpad, vbord)
-    w.refresh()
-    
-    #winner message
-    if winner != None:
-        msg = 'Player {} has won the game! Press enter to return to the menu.'
-        w.addstr(1, midx - len(msg)//2, msg.format(winner + 1))
-#         stdscr.addstr(height-1, 0, statusbarstr)
-        curses.nocbreak()
-        curses.flushinp()
-        window.getch()
-        curses.cbreak()
+    def __init__(self, w, rows=6, cols=7, char_dict={0:' ', 1:'X', 2:'0'}):
+        self.w = w
+        self.rows = rows
+        self.cols = cols
+        self.char_dict = char_dict
+        #midpoints of window
+        midy = sh // 2
+        midx = sw // 2
+        self.top = midy - rows//2
+        self.left = midx - cols//2
+        self.drawn = None
+
+    def draw(self, cells):
+        '''Writes the cells (as returned by Connect_Four_Bitboard.cells) that differ from those
+        last drawn, drawing the whole board if it has not been drawn yet. The window is only
+        marked for refresh: call curses.doupdate() to update the screen.
+        '''
+        if self.drawn is None:
+            self.w.erase()
+            self.draw_border()
+            self.drawn = [[None] * self.cols for _ in range(self.rows)]
+        for i, (row, drawn_row) in enumerate(zip(cells, self.drawn)):
+            for j, val in enumerate(row):
+                if drawn_row[j] != val:
+                    self.w.addch(self.top + i, self.left + j, self.char_dict[val])
+                    drawn_row[j] = val
+        self.w.noutrefresh()
+
+    def draw_border(self):
+        '''Draws the border around the board and the column numbers below it.'''
+        rows, cols, w = self.rows, self.cols, self.w
+        vpad, hpad = 1, 1 #number of spaces to leave btwn board and border
+        vbord, hbord =  curses.ACS_VLINE, curses.ACS_HLINE #chars to use for vertical/horizontal borders
+        bordw = cols + hpad*2 #border width
+        bordh = rows + vpad*2 #border height
+
+        #top and bottom
+        for i in range(bordw):
+            w.addch(self.top - hpad, self.left - hpad + i, hbord)
+            w.addch(self.top + rows + hpad - 1, self.left - hpad + i, hbord)
+
+        #column numbers
+        for i in range(cols):
+            w.addch(self.top + rows + 1, self.left + i, str(i+1))
+
+        #sides
+        for i in range(bordh):
+            w.addch(self.top - vpad + i, self.left - vpad, vbord)
+            w.addch(self.top - vpad + i, self.left + cols + vpad - 1, vbord)
+
+    def draw_stats(self, title, report, hint=''):
+        '''Writes a panel to the right of the board: title, the search's progress in report (see
+        Search_Worker.report) with a bar for the share of the root's simulations each column has
+        had, and hint on the bottom line of the window.
+        '''
+        lines = [title]
+        if report is not None:
+            total = sum(report['visits'].values()) or 1
+            lines += [
+                'simulations: {:,} ({:,.0f}/s)'.format(report['total_sims'],
+                                                       report['sims_per_second']),
+                'tree: {:,} nodes'.format(report['nodes']),
+                '{}: {} ({:.0%})'.format('expecting' if report['pondering'] else 'best move',
+                                         report['action'] + 1, report['confidence']),
+                '',
+            ]
+            for col in range(self.cols):
+                share = report['visits'].get(col, 0) / total
+                lines.append('{} {:<12} {:>4.0%}'.format(col + 1, '#' * round(share * 12), share))
+        x = self.left + self.cols + 4
+        for i in range(max(len(lines), self.rows + 8)):
+            line = lines[i] if i < len(lines) else ''
+            add_clipped(self.w, self.top - 1 + i, x, line.ljust(32))
+        add_clipped(self.w, sh - 1, 0, hint.ljust(sw))
+        self.w.noutrefresh()
+
+def add_clipped(w, y, x, text):
+    '''Writes text at y, x in window w, cut off at the right edge of the window (one short of it,
+    as curses can't write to the bottom right corner) instead of raising.
+    '''
+    if 0 <= y < sh and 0 <= x < sw - 1:
+        w.addstr(y, x, text[:sw - x - 1])
+
+class Search_Worker():
+    '''Runs an MCTS search in a background thread, so that the interface can keep drawing and
+    reading input while the AI thinks or ponders.
+
+    Arguments:
+        search:
+            MCTS - the search to run. Neither it nor its game may be changed while a search runs.
+        report_every:
+            int - number of iterations between updates of report, and between checks for
+            a request to stop.
 
-def ai_play(window):
-    game = Connect_Four()
-    print_board(game.board, window)
-    while not game.game_over:
-        m = MCTS(game, MCTS_time)
-        game.play(m.run_MCTS())
-        print_board(game.board, window)
-    print_board(game.board, window, winner=game.winner)
-
-def human_play(window):
-    game = Connect_Four()
-    print_board(game.board, window)
-    while not game.game_over:
-        #input handling
-        valid_input = False
-        while not valid_input:
-            curses.flushinp()
-            move = window.getch()
+    Attributes:
+        report:
+            dict - progress of the current search, or None before its first report: 'pondering',
+            'iterations', 'total_sims' (including those kept from earlier searches), 'nodes',
+            'seconds', 'sims_per_second', the best 'action' so far, the share of the root's
+            simulations it has had ('confidence'), and 'visits', a dict from each of the root's
+            actions to its number of simulations.
+    '''
+    def __init__(self, search, report_every=250):
+        self.search = search
+        self.report_every = report_every
+        self.report = None
+        self.thread = None
+        self.stop_requested = threading.Event()
+
+    def think(self, seconds):
+        '''Starts searching for the move to play, for at most seconds.'''
+        self.search.seconds_allowed = seconds
+        self.search.max_nodes = None
+        self.start(pondering=False)
+
+    def ponder(self, max_nodes=PONDER_NODES):
+        '''Starts searching while the opponent chooses their move, until 'stop' is called or
+        max_nodes nodes have been added to the tree (which may already be large, having been
+        kept by MCTS.advance). Once the opponent's move is passed to MCTS.advance, the
+        simulations spent on it are kept for the next search.
+        '''
+        self.search.seconds_allowed = None
+        self.search.max_nodes = self.search.node_count() + max_nodes
+        self.start(pondering=True)
+
+    def start(self, pondering):
+        '''Runs the search in a new thread.'''
+        self.pondering = pondering
+        self.report = None
+        self.move = None
+        self.error = None
+        self.stop_requested.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        '''Runs the search, updating report as it goes (in the worker thread).'''
+        search = self.search
+        start_time = time.time()
+        start_sims = search.total_sims
+        def callback(iterations, action, confidence):
+            seconds = time.time() - start_time
+            #replaced as a whole, so the interface never reads a half-updated report
+            self.report = {
+                'pondering': self.pondering, 'iterations': iterations,
+                'total_sims': search.total_sims, 'nodes': search.node_count(), 'seconds': seconds,
+                'sims_per_second': (search.total_sims - start_sims) / seconds if seconds else 0,
+                'action': action, 'confidence': confidence,
+                'visits': {child_action: num_sims
+                           for child_action, num_sims, _ in search.root_child_stats()},
+            }
+            return self.stop_requested.is_set()
+        try:
+            self.move = search.run_MCTS(callback, self.report_every)
+        except Exception as error:
+            self.error = error
+
+    def running(self):
+        '''Returns True while a search is running.'''
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self):
+        '''Asks the search to stop, and returns the move it chose (None if none was started).'''
+        if self.thread is None:
+            return None
+        self.stop_requested.set()
+        return self.result()
+
+    def result(self):
+        '''Waits for the search to finish, and returns the move it chose.'''
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+        return self.move
+
+def wait_for_ai(window, view, worker, title):
+    '''Redraws the search stats while worker thinks. Space stops the search and plays its best
+    move so far. Returns the move chosen, or None if q was pressed to leave the game.
+    '''
+    worker.think(MCTS_time)
+    while worker.running():
+        view.draw_stats('{} {:.1f}s / {:.1f}s'.format(
+            title, worker.report['seconds'] if worker.report else 0, MCTS_time),
+            worker.report, 'space: move now   q: quit')
+        curses.doupdate()
+        key = window.getch()
+        if key == ord('q'):
+            worker.stop()
+            return None
+        if key == ord(' '):
+            worker.stop_requested.set()
+    return worker.result()
+
+def wait_for_human(window, view, game, ponderer):
+    '''Reads the human's move, while ponderer (if not None) searches the position. Returns the
+    move chosen, or None if q was pressed to leave the game.
+    '''
+    if ponderer is not None:
+        ponderer.ponder()
+    try:
+        while True:
+            if ponderer is not None:
+                view.draw_stats('Your move (AI pondering)', ponderer.report, '1-7: play   q: quit')
+            else:
+                view.draw_stats('Your move', None, '1-7: play   q: quit')
+            curses.doupdate()
+            key = window.getch()
+            if key == ord('q'):
+                return None
             try:
-                move = int(chr(move)) - 1 # -1 to convert to 0 indexed
-            except (ValueError):
-                pass
+                move = int(chr(key)) - 1 # -1 to convert to 0 indexed
+            except (ValueError, OverflowError):
+                continue
+            #can't play in filled columns
+            if move in game.legal_actions():
+                return move
+    finally:
+        if ponderer is not None:
+            ponderer.stop()
+
+def play_game(window, ai_players):
+    '''Plays a game of connect 4 in window, with the AI playing for the players in ai_players and
+    the human for the others. Each AI player's search runs in a Search_Worker and its tree is
+    kept between its turns (see MCTS.advance). If pondering is on, the AI also searches during
+    the human's turns.
+    '''
+    game = Connect_Four_Bitboard()
+    view = Board_View(window, game.num_rows, game.num_cols)
+    workers = {player: Search_Worker(MCTS(game, MCTS_time)) for player in ai_players}
+    ponderer = next(iter(workers.values())) if pondering and len(workers) == 1 else None
+    window.timeout(REFRESH_MS)
+    try:
+        while not game.game_over:
+            view.draw(game.cells())
+            worker = workers.get(game.player_turn)
+            if worker is None:
+                move = wait_for_human(window, view, game, ponderer)
             else:
-                #validate column number
-                if move >= 0 and move < game.board.shape[1]:
-                    #can't play in filled columns
-                    if game.actions_available(boolean_out=True)[move].item() == 1:
-                        game.play(move)
-                        valid_input = True
-        
-        print_board(game.board, window)
-        if not game.game_over:
-            m = MCTS(game, MCTS_time)
-            game.play(m.run_MCTS())
-        print_board(game.board, window)
-    print_board(game.board, window, winner=game.winner)
-    
+                title = 'Player {} thinking'.format(game.player_turn + 1) if len(workers) > 1 \
+                    else 'AI thinking'
+                move = wait_for_ai(window, view, worker, title)
+            if move is None:
+                return
+            game.play(move)
+            for worker in workers.values():
+                worker.search.advance([move])
+    finally:
+        for worker in workers.values():
+            worker.stop()
+        window.timeout(-1)
+    view.draw(game.cells())
+    view.draw_stats('', None)
+
+    #winner message
+    if game.winner in (0, 1):
+        msg = 'Player {} has won the game! Press enter to return to the menu.'.format(game.winner + 1)
+    else:
+        msg = 'The game is a draw! Press enter to return to the menu.'
+    window.addstr(1, max(sw//2 - len(msg)//2, 0), msg)
+    curses.doupdate()
+    curses.nocbreak()
+    curses.flushinp()
+    window.getch()
+    curses.cbreak()
+
 def print_menu(w, menu, selected_row_idx):
     '''TODO Docstring
     
@@ -159,12 +352,13 @@ window = curses.newwin(sh, sw, 0, 0)
 window.keypad(True)
 
 curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
-menu = ['Human vs AI','AI vs AI', 'Set Allowed \'Thinking Time\'','Exit']
+menu = ['Human vs AI','AI vs AI', 'Set Allowed \'Thinking Time\'','AI Pondering: On','Exit']
 print_menu(window,menu, 0)
 
 exit = False
 current_row = 0
 MCTS_time = 1.0
+pondering = True #whether the AI searches during the human's turns
 
 # Menu loop -> always return to menu after resolving menu selections
 while not exit:
@@ -176,9 +370,9 @@ while not exit:
         current_row += 1
     elif key == curses.KEY_ENTER or key == 10 or key == 13:
         if current_row == 0:
-            human_play(window)
+            play_game(window, ai_players=[1])
         elif current_row == 1:
-            ai_play(window)
+            play_game(window, ai_players=[0, 1])
         elif current_row == 2:
             window.clear()
             window.addstr('Enter the number of seconds the algorithm is '
@@ -188,6 +382,9 @@ while not exit:
             MCTS_time = get_float(window, min_val=0.2, max_val=10)
             str_inp_mode(False)
         elif current_row == 3:
+            pondering = not pondering
+            menu[3] = 'AI Pondering: {}'.format('On' if pondering else 'Off')
+        elif current_row == 4:
             exit = True
     print_menu(window, menu, current_row)
 
@@ -0,0 +1,275 @@
+'''Connect_N: generalised connect four on any board size and row length, with or without gravity.
+Without gravity, pieces may be placed on any empty cell, which makes it an m,n,k-game, e.g.
+tic-tac-toe (3, 3, 3) or gomoku (15, 15, 5). Varying the board size varies the branching factor,
+for measuring how MCTS scales with it (see 'python benchmark.py branching').
+
+Usage example:
+    game = Connect_N(num_rows=9, num_cols=9, connect=5, gravity=False)
+    move = MCTS(game, 1.0).run_MCTS()
+'''
+import random
+
+import numpy as np
+
+from game import Game
+
+class Connect_N(Game):
+    '''A game of k in a row on a num_rows by num_cols board, implementing the game protocol (see
+    game.Game) with bitboards as Connect_Four_Bitboard does. The bitboards are python ints, so
+    boards of any size are supported.
+
+    With gravity, an action is a column and the piece drops to its lowest empty cell, as in
+    connect four (Connect_N() plays the same game as Connect_Four_Bitboard). Without gravity, an
+    action is a cell, numbered col * num_rows + row.
+
+    Arguments:
+        num_rows, num_cols:
+            int - dimensions of the board.
+        connect:
+            int - number of pieces in a row (vertically, horizontally or diagonally) that wins.
+        gravity:
+            boolean - whether pieces drop to the bottom of their column.
+
+    Attributes:
+        num_rows, num_cols, connect, gravity:
+            as for the arguments of the same name.
+        bitboards:
+            list of 2 ints - bit (col * (num_rows + 1) + row) is set where that player has a
+            piece, with row 0 being the bottom row. The spare bit on top of every column keeps
+            shifted masks from wrapping from one column into the next.
+        column_heights:
+            list of ints - number of pieces in a particular column. Only used with gravity.
+        position_hash:
+            int - Zobrist hash of the position, updated incrementally in play. rollout does not
+            update it and sets it to None instead; use get_hash, which recomputes it if needed.
+        num_actions, legal_mask:
+            as for game.Game
+        game_over, winner, player_turn, print_game, last_actions, num_plays:
+            as for connect4.Connect_Four
+    '''
+    def __init__(self, num_rows=6, num_cols=7, connect=4, gravity=True):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.connect = connect
+        self.gravity = gravity
+        height = num_rows + 1
+        self._height = height
+        self._num_cells = num_rows * num_cols
+        #the bit of each action's cell (the bottom cell of the column, with gravity)
+        if gravity:
+            self.num_actions = num_cols
+            self._action_bits = [col * height for col in range(num_cols)]
+        else:
+            self.num_actions = self._num_cells
+            self._action_bits = [col * height + row
+                                 for col in range(num_cols) for row in range(num_rows)]
+        #shifts for the 4 axes: vertical, horizontal and the two diagonals
+        self._shifts = (1, height, height - 1, height + 1)
+        #random 64-bit keys for Zobrist hashing, indexed by [player][bit]. The seed is fixed so
+        #that hashes agree between processes and between runs.
+        zobrist_random = random.Random(0)
+        self._zobrist = [[zobrist_random.getrandbits(64) for _ in range(num_cols * height)]
+                         for _ in range(2)]
+        self.bitboards = [0, 0]
+        self.column_heights = [0] * num_cols
+        self.legal_mask = (1 << self.num_actions) - 1
+        self.game_over = False
+        self.winner = np.nan
+        self.player_turn = 0
+        self.print_game = False
+        self.last_actions = [None, None]
+        self.num_plays = 0
+        self.position_hash = 0
+
+    def reset(self):
+        '''Reset the game to beginning.'''
+        self.__init__(self.num_rows, self.num_cols, self.connect, self.gravity)
+
+    @property
+    def board(self):
+        '''numpy array of the board, as Connect_Four.board (row 0 is the top row).'''
+        board = np.zeros((self.num_rows, self.num_cols), dtype=np.int64)
+        for player in (0, 1):
+            bitboard = self.bitboards[player]
+            for col in range(self.num_cols):
+                for row in range(self.num_rows):
+                    if bitboard >> (col * self._height + row) & 1:
+                        board[(self.num_rows-1) - row, col] = player + 1
+        return board
+
+    def has_connection(self, bitboard):
+        '''Returns True if bitboard contains connect pieces in a row along any axis. The runs are
+        found by doubling: after ANDing with itself shifted by length cells, a bit is set where a
+        run of twice the length starts.
+        '''
+        connect = self.connect
+        for shift in self._shifts:
+            runs = bitboard
+            length = 1
+            while 2 * length <= connect:
+                runs &= runs >> (length * shift)
+                length *= 2
+            if length < connect:
+                runs &= runs >> ((connect - length) * shift)
+            if runs:
+                return True
+        return False
+
+    def get_reward(self):
+        '''Return tuple of rewards associated w/ current game state for
+        players (0, 1) respectively.
+        '''
+        if self.game_over:
+            if self.winner == 0:
+                return (1,-1)
+            elif self.winner == 1:
+                return (-1,1)
+        return (0,0) #draw, or game not done
+
+    def action_bit(self, action):
+        '''Returns the bit of the cell the current player would fill by playing action.'''
+        if self.gravity:
+            return 1 << (self._action_bits[action] + self.column_heights[action])
+        return 1 << self._action_bits[action]
+
+    def play(self, action):
+        '''Play a piece for current player with 'action'. Also change player_turn and check for a
+        winner.
+        '''
+        action = int(action)
+        if action < 0 or action >= self.num_actions:
+            raise Exception('invalid action: {}'.format(action))
+        if not self.legal_mask >> action & 1:
+            raise Exception("Board space already occupied")
+        bit = self.action_bit(action)
+        player = self.player_turn
+        self.position_hash = self.get_hash() ^ self._zobrist[player][bit.bit_length() - 1]
+        self.bitboards[player] |= bit
+        if self.gravity:
+            self.column_heights[action] += 1
+            if self.column_heights[action] == self.num_rows:
+                self.legal_mask &= ~(1 << action)
+        else:
+            self.legal_mask &= ~(1 << action)
+        self.last_actions[player] = action
+        self.num_plays += 1
+        self.player_turn = 1 - player
+        if self.num_plays >= 2 * self.connect - 1 and self.has_connection(self.bitboards[player]):
+            self.game_over = True
+            self.winner = player
+        elif self.num_plays == self._num_cells:
+            self.game_over = True
+
+    def undo(self, action):
+        '''Takes back action, which must be the last one played. last_actions for the player who
+        played it becomes None.
+        '''
+        player = 1 - self.player_turn
+        if self.gravity:
+            self.column_heights[action] -= 1
+        bit = self.action_bit(action)
+        self.position_hash = self.get_hash() ^ self._zobrist[player][bit.bit_length() - 1]
+        self.bitboards[player] ^= bit
+        self.legal_mask |= 1 << action
+        self.last_actions[player] = None
+        self.num_plays -= 1
+        self.player_turn = player
+        self.game_over = False
+        self.winner = np.nan
+
+    def rollout(self):
+        '''Plays out the rest of the game with random moves by both players. As in
+        Connect_Four_Bitboard.rollout, the moves are made on local copies of the state rather than
+        through play.
+        '''
+        if self.print_game:
+            while not self.game_over:
+                self.random_move(self.player_turn)
+            return
+        if self.game_over:
+            return
+        bitboards = self.bitboards
+        heights = self.column_heights
+        action_bits = self._action_bits
+        gravity = self.gravity
+        num_rows = self.num_rows
+        has_connection = self.has_connection
+        legal_mask = self.legal_mask
+        legal = list(self.legal_actions())
+        player = self.player_turn
+        num_plays = self.num_plays
+        first_win = 2 * self.connect - 1
+        randrange = random.randrange
+        last_actions = self.last_actions
+        while True:
+            index = randrange(len(legal))
+            action = legal[index]
+            if gravity:
+                height = heights[action]
+                bit = 1 << (action_bits[action] + height)
+                heights[action] = height + 1
+                full = height + 1 == num_rows
+            else:
+                bit = 1 << action_bits[action]
+                full = True
+            if full: #remove the action by moving the last legal action into its place
+                legal[index] = legal[-1]
+                legal.pop()
+                legal_mask &= ~(1 << action)
+            bitboard = bitboards[player] | bit
+            bitboards[player] = bitboard
+            last_actions[player] = action
+            num_plays += 1
+            player = 1 - player
+            if num_plays >= first_win and has_connection(bitboard):
+                self.winner = 1 - player
+                break
+            if not legal:
+                break
+        self.legal_mask = legal_mask
+        self.player_turn = player
+        self.num_plays = num_plays
+        self.position_hash = None
+        self.game_over = True
+
+    def snapshot(self):
+        '''Returns an immutable tuple holding the full game state, for passing to restore later.'''
+        return (self.bitboards[0], self.bitboards[1], tuple(self.column_heights), self.legal_mask,
+                self.game_over, self.winner, self.player_turn, self.last_actions[0],
+                self.last_actions[1], self.num_plays, self.position_hash)
+
+    def restore(self, snapshot):
+        '''Return the game to the state captured by snapshot, reusing the existing lists.'''
+        (self.bitboards[0], self.bitboards[1], column_heights, self.legal_mask, self.game_over,
+         self.winner, self.player_turn, self.last_actions[0], self.last_actions[1],
+         self.num_plays, self.position_hash) = snapshot
+        self.column_heights[:] = column_heights
+
+    def get_hash(self):
+        '''Returns the Zobrist hash (int) of the current position.'''
+        if self.position_hash is None:
+            position_hash = 0
+            for player in (0, 1):
+                bitboard = self.bitboards[player]
+                while bitboard:
+                    bit = bitboard & -bitboard
+                    position_hash ^= self._zobrist[player][bit.bit_length() - 1]
+                    bitboard ^= bit
+            self.position_hash = position_hash
+        return self.position_hash
+
+    def hash_after(self, action):
+        '''Returns the hash the position would have after the current player plays action,
+        without playing it.
+        '''
+        bit = self.action_bit(action)
+        return self.get_hash() ^ self._zobrist[self.player_turn][bit.bit_length() - 1]
+
+    def get_state(self):
+        '''Returns tuple of board (2d numpy array) and turn (int)'''
+        return (self.board, self.player_turn)
+
+    def print_board(self):
+        '''Output the current board state to console'''
+        print(self.board)
+        print("last action was: ", self.last_actions[1-self.player_turn])
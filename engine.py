@@ -0,0 +1,230 @@
+'''Asyncio API for serving moves to many concurrent games from one shared pool of worker
+processes.
+
+    engine = Engine(max_queue=500)
+    action = await engine.choose_move(game, 0.1, deadline=time.time() + 1)
+
+Each request runs one MCTS search in the pool. At most one search per worker runs at a time, and
+requests waiting for a worker are served in the order they arrived, so a burst of requests from
+some games cannot starve the others. Requests beyond max_queue waiting are rejected at once
+(Engine_Overloaded) rather than queued, and a request whose deadline passes while it waits fails
+with Deadline_Exceeded instead of being searched.
+
+Running this module runs a local stress test, with many simulated clients playing games against
+random opponents, and prints the throughput, latency percentiles and engine metrics as JSON:
+    python engine.py --clients 300 --moves 5 --seconds 0.02
+'''
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+import numpy as np
+
+from MCTS import MCTS, make_pool, pool_workers
+from connect4 import Connect_Four_Bitboard
+
+class Engine_Overloaded(Exception):
+    '''Raised by Engine.choose_move when too many requests are already waiting.'''
+
+class Deadline_Exceeded(Exception):
+    '''Raised by Engine.choose_move when a request's deadline passes before it is searched.'''
+
+def _engine_search(game, settings, seed):
+    '''Worker function: runs one search of game, returning the action chosen and the number of
+    iterations run.
+    '''
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+    settings = dict(settings)
+    search = MCTS(game, settings.pop('time', None), **settings)
+    action = search.run_MCTS()
+    return int(action), search.iterations
+
+class Engine():
+    '''Chooses moves for many concurrent games, with searches spread over a process pool.
+
+    Arguments:
+        pool:
+            concurrent.futures.ProcessPoolExecutor (e.g. from make_pool) to run the searches in.
+            A new pool with workers processes is made if None.
+        workers:
+            int - number of searches run at once. Defaults to the number of workers in pool (see
+            MCTS.pool_workers), or to the number of cores.
+        max_queue:
+            int - maximum number of requests waiting for a worker. Defaults to 8 per worker.
+        settings:
+            dict - keyword arguments for MCTS used for every search, e.g. exploration.
+        latency_window:
+            int - number of recent requests whose latency is kept for the percentiles in
+            'metrics'.
+
+    Attributes:
+        queued, running:
+            int - number of requests waiting for a worker, and being searched.
+        completed, rejected, deadline_missed:
+            int - number of requests that returned a move, were rejected by admission control,
+            and failed because their deadline passed while waiting.
+        max_queue_depth:
+            int - greatest value queued has reached.
+        latencies:
+            collections.deque of the seconds taken by recent completed requests, including time
+            spent waiting.
+        pool, workers, max_queue, settings:
+            as for the arguments of the same name.
+    '''
+    def __init__(self, pool=None, workers=None, max_queue=None, settings=None,
+                 latency_window=10000):
+        self.owns_pool = pool is None
+        self.pool = make_pool(workers) if pool is None else pool
+        self.workers = workers or pool_workers(self.pool)
+        self.max_queue = max_queue if max_queue is not None else 8 * self.workers
+        self.settings = settings or {}
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.deadline_missed = 0
+        self.max_queue_depth = 0
+        self.latencies = collections.deque(maxlen=latency_window)
+        self._slots = asyncio.Semaphore(self.workers)
+
+    async def choose_move(self, game, budget, deadline=None):
+        '''Searches game's current position and returns the (int) action chosen. The game is
+        copied when the search starts, so it may be changed once this returns.
+
+        Arguments:
+            game:
+                object - game to choose a move in, e.g. Connect_Four_Bitboard.
+            budget:
+                float - seconds to search for, or dict of MCTS budget keyword arguments, e.g.
+                {'max_iterations': 2000}.
+            deadline:
+                float - time.time() value by which the move is needed, or None. The search
+                stops by the deadline even if its budget is not used up.
+        '''
+        start_time = time.time()
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise Engine_Overloaded('{} requests already waiting'.format(self.queued))
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        try:
+            timeout = None if deadline is None else deadline - start_time
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.deadline_missed += 1
+            raise Deadline_Exceeded('deadline passed while waiting for a worker')
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            settings = dict(self.settings, deadline=deadline)
+            if isinstance(budget, dict):
+                settings.update(budget)
+            else:
+                settings['time'] = budget
+            action, _ = await asyncio.get_running_loop().run_in_executor(
+                self.pool, _engine_search, game, settings, random.getrandbits(32))
+        finally:
+            self.running -= 1
+            self._slots.release()
+        self.completed += 1
+        self.latencies.append(time.time() - start_time)
+        return action
+
+    def metrics(self):
+        '''Returns dict of the counters in the attributes, with percentiles of recent latencies.'''
+        metrics = {name: getattr(self, name) for name in (
+            'queued', 'running', 'completed', 'rejected', 'deadline_missed', 'max_queue_depth')}
+        if self.latencies:
+            latencies = np.array(self.latencies)
+            for percentile in (50, 95, 99):
+                metrics['latency_p{}'.format(percentile)] = float(
+                    np.percentile(latencies, percentile))
+            metrics['latency_max'] = float(latencies.max())
+        return metrics
+
+    def close(self):
+        '''Shuts down the pool, if the engine made it.'''
+        if self.owns_pool:
+            self.pool.shutdown()
+
+async def _client(engine, moves, budget, patience, rng, report):
+    '''One simulated client: plays up to moves moves of a game against a random opponent, asking
+    engine for each move with a deadline of patience seconds. Retries after a short wait when
+    rejected, and plays a random move when a deadline is missed.
+    '''
+    game = Connect_Four_Bitboard()
+    game.play(rng.choice(game.legal_actions())) #so that the clients' games differ
+    for _ in range(moves):
+        if game.game_over:
+            break
+        start_time = time.time()
+        while True:
+            try:
+                action = await engine.choose_move(game, budget, deadline=start_time + patience)
+                break
+            except Engine_Overloaded:
+                report['retries'] += 1
+                await asyncio.sleep(0.01 * (1 + rng.random()))
+            except Deadline_Exceeded:
+                action = rng.choice(game.legal_actions())
+                break
+        report['latencies'].append(time.time() - start_time)
+        game.play(action)
+        if not game.game_over:
+            game.play(rng.choice(game.legal_actions()))
+
+async def stress_test(engine, clients, moves, budget, patience, seed=0):
+    '''Runs clients simulated clients at once (see _client) against engine, and returns dict of
+    the move throughput, client-side latency percentiles (including retries), and the engine's
+    metrics.
+    '''
+    rng = random.Random(seed)
+    report = {'latencies': [], 'retries': 0}
+    start_time = time.time()
+    await asyncio.gather(*(
+        _client(engine, moves, budget, patience, random.Random(rng.getrandbits(32)), report)
+        for _ in range(clients)
+    ))
+    seconds = time.time() - start_time
+    latencies = np.array(report['latencies'])
+    return {
+        'clients': clients,
+        'seconds': seconds,
+        'moves_per_second': len(latencies) / seconds,
+        'retries': report['retries'],
+        'latency_p50': float(np.percentile(latencies, 50)),
+        'latency_p95': float(np.percentile(latencies, 95)),
+        'latency_p99': float(np.percentile(latencies, 99)),
+        'latency_max': float(latencies.max()),
+        'engine': engine.metrics(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=300, help='concurrent simulated games')
+    parser.add_argument('--moves', type=int, default=5, help='engine moves per game')
+    parser.add_argument('--seconds', type=float, default=0.02, help='search time per move')
+    parser.add_argument('--patience', type=float, default=5,
+                        help="seconds a client waits for a move (the request's deadline)")
+    parser.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--max-queue', type=int, help='requests waiting before rejecting more')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    async def run():
+        engine = Engine(workers=args.workers, max_queue=args.max_queue)
+        try:
+            return await stress_test(engine, args.clients, args.moves, args.seconds,
+                                     args.patience, args.seed)
+        finally:
+            engine.close()
+    print(json.dumps(asyncio.run(run()), indent=2))
+
+if __name__ == '__main__':
+    main()
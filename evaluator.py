@@ -0,0 +1,188 @@
+'''Neural network evaluation of leaves for MCTS (see the evaluator argument of MCTS), in the style
+of AlphaZero: a network maps a position to prior probabilities for each action, which guide the
+selection step (PUCT), and to an estimate of the position's value, which replaces or is mixed
+with the result of a rollout.
+
+Evaluating one position at a time wastes most of a forward pass on overhead, so positions are
+queued by a Batch_Evaluator and evaluated together, once enough are waiting or the oldest has
+waited long enough. Several searches or search threads may share one Batch_Evaluator, so that
+their leaves are batched together.
+
+This is the only module that needs PyTorch, which is installed by requirements-evaluator.txt
+rather than requirements.txt.
+
+Usage example:
+    from evaluator import Batch_Evaluator, Connect_Four_Net
+    evaluator = Batch_Evaluator(Connect_Four_Net(), batch_size=32)
+    move = MCTS(game, 1.0, batch_size=32, evaluator=evaluator).run_MCTS()
+'''
+import threading
+import time
+
+import numpy as np
+import torch
+
+#bit of a Connect_Four_Bitboard for each cell of the board, with row 0 being the top row as in
+#Connect_Four.board
+_CELL_BITS = np.array([[col * 7 + (5 - row) for col in range(7)] for row in range(6)],
+                      dtype=np.uint64)
+
+class Connect_Four_Net(torch.nn.Module):
+    '''Tiny reference network for connect four: two convolutional layers, then a policy head giving
+    a logit for each column and a value head giving the value of the position (from -1 to 1) for
+    the player to move. Its weights are untrained unless loaded with load_state_dict.
+
+    Any other network can be used by a Batch_Evaluator, as long as it has an 'encode' method and
+    maps a batch of encoded positions to (policy logits, values) in the same way.
+
+    Arguments:
+        channels:
+            int - number of channels in the convolutional layers.
+    '''
+    def __init__(self, channels=32):
+        super().__init__()
+        self.body = torch.nn.Sequential(
+            torch.nn.Conv2d(2, channels, 3, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.Conv2d(channels, channels, 3, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.Flatten(),
+        )
+        self.policy_head = torch.nn.Linear(channels * 6 * 7, 7)
+        self.value_head = torch.nn.Sequential(
+            torch.nn.Linear(channels * 6 * 7, 32),
+            torch.nn.ReLU(),
+            torch.nn.Linear(32, 1),
+            torch.nn.Tanh(),
+        )
+
+    @staticmethod
+    def encode(game):
+        '''Returns numpy array of shape (2, 6, 7): 1 where the player to move has a piece in the
+        first plane, and where the opponent does in the second. Works for Connect_Four (through
+        get_state) and, more quickly, for Connect_Four_Bitboard.
+        '''
+        player = game.player_turn
+        if hasattr(game, 'bitboards'):
+            bitboards = np.array([game.bitboards[player], game.bitboards[1 - player]],
+                                 dtype=np.uint64)
+            return ((bitboards[:, None, None] >> _CELL_BITS) & np.uint64(1)).astype(np.float32)
+        board, player = game.get_state()
+        board = np.asarray(board)
+        return np.stack([board == player + 1, board == 2 - player]).astype(np.float32)
+
+    def forward(self, x):
+        '''Returns tuple of policy logits, shape (N, 7), and values, shape (N,), for a batch of
+        encoded positions x, shape (N, 2, 6, 7).
+        '''
+        features = self.body(x)
+        return self.policy_head(features), self.value_head(features).squeeze(1)
+
+class _Request():
+    '''A position waiting in a Batch_Evaluator, and its result (or the exception raised while
+    evaluating it) once evaluated.
+    '''
+    __slots__ = ('state', 'time', 'priors', 'value', 'error', 'done')
+
+    def __init__(self, state, queued_time):
+        self.state = state
+        self.time = queued_time
+        self.priors = None
+        self.value = None
+        self.error = None
+        self.done = False
+
+class Batch_Evaluator():
+    '''Batches the evaluation of positions by a network. Positions passed to 'evaluate' are queued,
+    and a batch is run as soon as batch_size positions are queued, or timeout seconds after the
+    oldest was queued, whichever is first. There is no separate thread: the batch is run by one
+    of the threads waiting on it.
+
+    With a single search thread, use a search batch_size of at least the evaluator's batch_size
+    (or timeout=0), so that no time is spent waiting for positions that will not come.
+
+    Arguments:
+        model:
+            torch.nn.Module - network with an encode(game) method returning a numpy array, and a
+            forward pass mapping a batch of encoded positions to (policy logits over all actions,
+            values for the player to move). Put into evaluation mode.
+        batch_size:
+            int - maximum number of positions per forward pass.
+        timeout:
+            float - seconds a queued position may wait for a full batch.
+
+    Attributes:
+        batches, positions:
+            int - number of forward passes run, and of positions evaluated.
+        model, batch_size, timeout:
+            as for the arguments of the same name.
+    '''
+    def __init__(self, model, batch_size=32, timeout=0.002):
+        self.model = model.eval()
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.batches = 0
+        self.positions = 0
+        self._pending = []
+        self._condition = threading.Condition()
+
+    def encode(self, game):
+        '''Returns the encoding of game's current position, for passing to 'evaluate'.'''
+        return self.model.encode(game)
+
+    def evaluate(self, states):
+        '''Evaluates the encoded positions in states, together with any positions queued by other
+        threads. Blocks until all of them are done.
+
+        Returns list of (priors, value) for each of states: numpy array of the probability of
+        each action, and the value (float from -1 to 1) for the player to move. If the model
+        raises while evaluating a batch, every thread with a position in that batch raises the
+        same exception.
+        '''
+        condition = self._condition
+        with condition:
+            now = time.perf_counter()
+            requests = [_Request(state, now) for state in states]
+            self._pending.extend(requests)
+            condition.notify_all()
+        for request in requests:
+            while not request.done:
+                with condition:
+                    if request.done:
+                        break
+                    pending = self._pending
+                    wait = self.timeout - (time.perf_counter() - pending[0].time) if pending else None
+                    if pending and (len(pending) >= self.batch_size or wait <= 0):
+                        batch = pending[:self.batch_size]
+                        del pending[:self.batch_size]
+                    else:
+                        condition.wait(wait)
+                        continue
+                try:
+                    self.run_batch(batch)
+                except BaseException as error:
+                    #the batch may hold other threads' positions, which must not wait forever
+                    for batch_request in batch:
+                        batch_request.error = error
+                        batch_request.done = True
+                    raise
+                finally:
+                    with condition:
+                        condition.notify_all()
+            if request.error is not None:
+                raise request.error
+        return [(request.priors, request.value) for request in requests]
+
+    def run_batch(self, requests):
+        '''Runs one forward pass for the queued requests and stores their results.'''
+        x = torch.from_numpy(np.stack([request.state for request in requests]))
+        with torch.no_grad():
+            logits, values = self.model(x)
+            priors = torch.softmax(logits, dim=1).numpy()
+            values = values.numpy()
+        for request, request_priors, value in zip(requests, priors, values):
+            request.priors = request_priors
+            request.value = float(value)
+            request.done = True
+        self.batches += 1
+        self.positions += len(requests)
@@ -0,0 +1,114 @@
+'''The interface MCTS expects of a game, as a base class with default implementations of
+everything that can be written in terms of the rest.
+
+A game has two players, 0 and 1, who take turns. Actions are ints from 0 to num_actions - 1,
+and the actions legal in a position are given as an int bitmask, so that no per-move arrays or
+tensors are needed. Subclasses must implement play, undo, get_reward, get_hash, snapshot and
+restore, and keep the attributes up to date; the other methods may be overridden with faster
+versions, e.g. a rollout that plays its moves without calling play.
+'''
+import random
+
+class Game():
+    '''Base class for games searched by MCTS.
+
+    Attributes:
+        num_actions:
+            int - number of action ids. Actions are ints from 0 to num_actions - 1.
+        legal_mask:
+            int - bit a is set if action a may be played in the current position. Only
+            meaningful while the game is not over.
+        player_turn:
+            int - which player's turn it is (0 or 1)
+        game_over:
+            boolean - whether the game is over
+        num_plays:
+            int - total number of turns taken so far
+        print_game:
+            boolean - flag for controlling if game should be output to console
+    '''
+    num_actions = 0
+
+    def play(self, action):
+        '''Plays action (int) for the current player, then passes the turn and checks whether the
+        game is over.
+        '''
+        raise NotImplementedError
+
+    def undo(self, action):
+        '''Takes back action, which must be the last action played (by the other player), returning
+        the game to the position before it.
+        '''
+        raise NotImplementedError
+
+    def get_reward(self):
+        '''Return tuple of rewards associated w/ current game state for players (0, 1)
+        respectively, each in the range -1 to 1 and (0, 0) if the game is not over.
+        '''
+        raise NotImplementedError
+
+    def get_hash(self):
+        '''Returns an int hash of the current position, equal for equal positions.'''
+        raise NotImplementedError
+
+    def snapshot(self):
+        '''Returns an object holding the full game state, for passing to restore later. It must
+        be unaffected by later plays, and picklable.
+        '''
+        raise NotImplementedError
+
+    def restore(self, snapshot):
+        '''Return the game to the state captured by snapshot.'''
+        raise NotImplementedError
+
+    def legal_actions(self):
+        '''Returns sequence of the (int) actions that may be played, empty if the game is over.'''
+        if self.game_over:
+            return ()
+        mask = self.legal_mask
+        actions = []
+        while mask:
+            bit = mask & -mask
+            actions.append(bit.bit_length() - 1)
+            mask ^= bit
+        return actions
+
+    def hash_after(self, action):
+        '''Returns the hash the position would have after the current player plays action.'''
+        self.play(action)
+        position_hash = self.get_hash()
+        self.undo(action)
+        return position_hash
+
+    def random_move(self, player_num):
+        '''Player indicated by player_num takes action at random.'''
+        rand_action = random.choice(self.legal_actions())
+        self.play(rand_action)
+        if self.print_game: print("player ", player_num, " played ", rand_action)
+
+    def rollout(self):
+        '''Plays out the rest of the game with random moves by both players.'''
+        while not self.game_over:
+            self.random_move(self.player_turn)
+
+    def batch_rollout(self, snapshots):
+        '''Returns list of rewards for players (0, 1) from rolling out each position in snapshots.
+        Leaves the game in the position of the last rollout.
+        '''
+        results = []
+        for snapshot in snapshots:
+            self.restore(snapshot)
+            self.rollout()
+            results.append(self.get_reward())
+        return results
+
+    def reset(self):
+        '''Reset the game to beginning.'''
+        self.__init__()
+
+    def set_print_game(self, boolean):
+        self.print_game = boolean
+
+    def print_board(self):
+        '''Output the current board state to console'''
+        print(self)
@@ -0,0 +1,68 @@
+'''Playing games between MCTS configurations from a fixed set of openings, shared by the benchmarks
+and the tournament.
+'''
+import random
+
+import numpy as np
+
+from MCTS import MCTS
+from array_tree import Array_MCTS
+from connect4 import Connect_Four_Bitboard
+from rollout_policies import make_policy
+
+ENGINES = {'nodes': MCTS, 'arrays': Array_MCTS}
+
+#fixed set of opening positions, as lists of columns played from the empty board
+OPENINGS = [[], [3], [3, 3], [2, 4], [3, 2, 4], [0, 6, 3, 3]]
+
+def opening_position(moves, game_class=Connect_Four_Bitboard):
+    '''Returns a new game with the columns in moves already played.'''
+    game = game_class()
+    for action in moves:
+        game.play(action)
+    return game
+
+def seed_all(seed):
+    '''Seeds both of the random number generators used by the engines.'''
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+def play_game(settings, seed, opening=()):
+    '''Plays one game between two players.
+
+    Arguments:
+        settings:
+            list of 2 dicts - keyword arguments to MCTS for players 0 and 1, plus optionally
+            'time' (seconds per move, default None), 'engine' (a key of ENGINES) and
+            'rollout_policy' (a name or dict, see rollout_policies.make_policy).
+        seed:
+            int - seed for the random number generators.
+        opening:
+            iterable of ints - columns to play before the players take over.
+
+    Returns the winner (0 or 1), or None for a draw.
+    '''
+    seed_all(seed)
+    game = opening_position(opening)
+    while not game.game_over:
+        kwargs = dict(settings[game.player_turn])
+        engine = ENGINES[kwargs.pop('engine', 'nodes')]
+        seconds = kwargs.pop('time', None)
+        kwargs['rollout_policy'] = make_policy(kwargs.get('rollout_policy'))
+        game.play(engine(game, seconds, **kwargs).run_MCTS())
+    return None if np.isnan(game.winner) else int(game.winner)
+
+def match_score(settings, baseline, seconds, games, seed=0):
+    '''Plays games between settings and baseline (both dicts of MCTS keyword arguments),
+    alternating who moves first. Returns the fraction of points won by settings, counting a draw
+    as half a point.
+    '''
+    points = 0
+    for i in range(games):
+        player = i % 2
+        pair = [baseline, baseline]
+        pair[player] = settings
+        pair = [dict(kwargs, time=seconds) for kwargs in pair]
+        winner = play_game(pair, seed + i, OPENINGS[(i // 2) % len(OPENINGS)])
+        points += 0.5 if winner is None else float(winner == player)
+    return points / games
@@ -0,0 +1,221 @@
+'''Persistent opening book for MCTS (see the book argument of MCTS): the statistics of the root's
+children from past searches, stored in an sqlite file keyed by the position's hash. A search
+whose position is in the book with enough simulations returns the book's move without searching,
+and otherwise starts from the book's statistics. Each search's results are written back.
+
+The book can also be built offline, searching every position up to a given number of moves
+deep from the empty board, spread over all cores.
+
+Usage example:
+    python opening_book.py build --output book.sqlite --depth 4 --iterations 20000
+    python opening_book.py lookup --book book.sqlite 3 3
+'''
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sqlite3
+import struct
+import threading
+
+import numpy as np
+
+from MCTS import MCTS
+from connect4 import Connect_Four_Bitboard
+from rollout_policies import make_policy
+
+#one child: action, num_sims and reward_sum
+_CHILD_FORMAT = struct.Struct('<hqd')
+
+class Opening_Book():
+    '''Root statistics of searched positions, stored in an sqlite file. The file is memory mapped
+    for reading, and may be shared by several processes.
+
+    Arguments:
+        path:
+            str - file to open, created if it does not exist.
+        min_sims:
+            int - positions with at least this many simulations in the book are played
+            directly from it by MCTS, without searching.
+
+    Attributes:
+        path, min_sims:
+            as for the arguments of the same name.
+        hits, misses:
+            int - number of lookups that found / did not find the position.
+        connection:
+            sqlite3.Connection - the open book file.
+        lock:
+            threading.Lock - serialises use of connection between threads.
+    '''
+    def __init__(self, path, min_sims=20000):
+        self.path = path
+        self.min_sims = min_sims
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA mmap_size = 268435456')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS positions '
+            '(hash INTEGER PRIMARY KEY, total_sims INTEGER, children BLOB)'
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def key(position_hash):
+        '''Returns position_hash (an unsigned 64-bit int) as the signed int sqlite stores.'''
+        return position_hash - (1 << 64) if position_hash >= 1 << 63 else position_hash
+
+    def lookup(self, position_hash):
+        '''Returns tuple of (total simulations, list of (action, num_sims, reward_sum) for each
+        child) stored for position_hash, or None if it is not in the book.
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT total_sims, children FROM positions WHERE hash = ?',
+                (self.key(position_hash),)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        total_sims, children = row
+        return total_sims, list(_CHILD_FORMAT.iter_unpack(children))
+
+    def store(self, position_hash, child_stats):
+        '''Stores the statistics of the root's children (list of (action, num_sims, reward_sum))
+        for position_hash, unless the book already has at least as many simulations for it.
+        Searches that start from the book's statistics include them, so keeping the larger entry
+        rather than adding the two avoids counting the same simulations twice.
+        '''
+        total_sims = sum(num_sims for _, num_sims, _ in child_stats)
+        children = b''.join(_CHILD_FORMAT.pack(int(action), int(num_sims), float(reward_sum))
+                            for action, num_sims, reward_sum in child_stats)
+        with self.lock:
+            self.connection.execute(
+                'INSERT INTO positions VALUES (?, ?, ?) ON CONFLICT(hash) DO UPDATE SET '
+                'total_sims = excluded.total_sims, children = excluded.children '
+                'WHERE excluded.total_sims > positions.total_sims',
+                (self.key(position_hash), total_sims, children)
+            )
+            self.connection.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def best_action(child_stats):
+        '''Returns the action with the greatest average reward in child_stats, breaking ties by
+        the last child, as MCTS.choose_move does for the tree.
+        '''
+        average = lambda child: child[2] / child[1] if child[1] else -math.inf
+        return max(enumerate(child_stats), key=lambda pair: (average(pair[1]), pair[0]))[1][0]
+
+def book_positions(depth):
+    '''Returns list of move lists reaching every distinct position (by hash) that is up to depth
+    moves from the empty board and not already over.
+    '''
+    positions = [[]]
+    frontier = [[]]
+    seen = {Connect_Four_Bitboard().get_hash()}
+    for _ in range(depth):
+        next_frontier = []
+        for moves in frontier:
+            game = _play(moves)
+            for action in game.actions_available():
+                child = _play(moves + [int(action)])
+                if child.game_over or child.get_hash() in seen:
+                    continue
+                seen.add(child.get_hash())
+                next_frontier.append(moves + [int(action)])
+        positions += next_frontier
+        frontier = next_frontier
+    return positions
+
+def _play(moves):
+    '''Returns a new game with the columns in moves played.'''
+    game = Connect_Four_Bitboard()
+    for action in moves:
+        game.play(action)
+    return game
+
+def _search_position(moves, settings, seed):
+    '''Worker function: searches the position reached by moves, returning its hash and the
+    statistics of the root's children.
+    '''
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+    game = _play(moves)
+    settings = dict(settings, rollout_policy=make_policy(settings.get('rollout_policy')))
+    search = MCTS(game, None, **settings)
+    for _ in search.anytime(None):
+        pass
+    return game.get_hash(), search.root_child_stats()
+
+def build_book(path, depth, settings, workers=None, seed=0):
+    '''Searches every position up to depth moves deep (see book_positions) with MCTS keyword
+    arguments settings, spread over a pool of worker processes, and stores the results in the
+    book at path. Positions already in the book with at least settings['max_iterations']
+    simulations are skipped, so an interrupted build can be resumed.
+
+    Returns the number of positions searched.
+    '''
+    book = Opening_Book(path)
+    target = settings.get('max_iterations') or 0
+    pending = []
+    for i, moves in enumerate(book_positions(depth)):
+        entry = book.lookup(_play(moves).get_hash())
+        if entry is None or entry[0] < target:
+            pending.append((moves, seed + i))
+    with concurrent.futures.ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_search_position, moves, settings, position_seed)
+                   for moves, position_seed in pending]
+        for future in concurrent.futures.as_completed(futures):
+            book.store(*future.result())
+    book.close()
+    return len(pending)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('build', help='search all positions up to a depth')
+    command.add_argument('--output', default='book.sqlite', help='book file to create or extend')
+    command.add_argument('--depth', type=int, default=4, help='moves from the empty board')
+    command.add_argument('--iterations', type=int, default=20000, help='iterations per position')
+    command.add_argument('--settings', type=json.loads, default={},
+                         help='other MCTS keyword arguments as JSON')
+    command.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    command.add_argument('--seed', type=int, default=0)
+    command = commands.add_parser('lookup', help="print the book's entry for a position")
+    command.add_argument('--book', default='book.sqlite')
+    command.add_argument('moves', type=int, nargs='*', help='columns played from the empty board')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        settings = dict(args.settings, max_iterations=args.iterations)
+        searched = build_book(args.output, args.depth, settings, args.workers, args.seed)
+        print(json.dumps({'positions_searched': searched,
+                          'positions_in_book': len(Opening_Book(args.output))}))
+    else:
+        entry = Opening_Book(args.book).lookup(_play(args.moves).get_hash())
+        if entry is None:
+            print(json.dumps(None))
+        else:
+            total_sims, child_stats = entry
+            print(json.dumps({
+                'total_sims': total_sims,
+                'best_action': Opening_Book.best_action(child_stats),
+                'children': [{'action': action, 'num_sims': num_sims, 'reward_sum': reward_sum}
+                             for action, num_sims, reward_sum in child_stats],
+            }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+'''Rollout policies for MCTS (see the rollout_policy argument of MCTS). A rollout policy plays out
+the game from the position of a leaf, or estimates its result, and returns the rewards for
+players (0, 1). Policies must be picklable to be used with root-parallel MCTS.
+
+POLICIES maps the name of each built-in policy to its class, so that policies can be chosen by
+name on the command line, e.g. by benchmark.py and tournament.py.
+'''
+import random
+
+from connect4 import (_HEIGHT, _FULL_PLAYS, _LEGAL_COLUMNS, _is_four, _playable_cells,
+                      _winning_cells, Connect_Four_Bitboard)
+
+class Rollout_Policy():
+    '''Base class for rollout policies. Subclasses implement 'rollout'.'''
+    def rollout(self, game):
+        '''Plays out game (which the caller restores afterwards, so it may be left in any state)
+        and returns tuple of rewards for players (0, 1), each in the range -1 to 1.
+        '''
+        raise NotImplementedError
+
+    def batch_rollout(self, game, snapshots):
+        '''Returns list of rewards for players (0, 1) from rolling out each position in snapshots
+        (see game.snapshot), using game to play them out.
+        '''
+        results = []
+        for snapshot in snapshots:
+            game.restore(snapshot)
+            results.append(self.rollout(game))
+        return results
+
+class Random_Rollout(Rollout_Policy):
+    '''Both players move uniformly at random, using the game's own rollout and batch_rollout. This
+    is what MCTS does when no rollout policy is given.
+    '''
+    def rollout(self, game):
+        game.rollout()
+        return game.get_reward()
+
+    def batch_rollout(self, game, snapshots):
+        if hasattr(game, 'batch_rollout'):
+            return game.batch_rollout(snapshots)
+        return super().batch_rollout(game, snapshots)
+
+class Heavy_Rollout(Rollout_Policy):
+    '''Heavy playouts for Connect_Four_Bitboard: each player plays a winning move if it has one,
+    otherwise blocks the opponent's winning move if it has one, otherwise moves at random. Both
+    checks are a few operations on the bitboards, so a heavy rollout costs only a few times as
+    much as a random one, and its results say more about the position.
+    '''
+    def rollout(self, game):
+        _bitboard_playout(game, heavy=True)
+        return game.get_reward()
+
+class Truncated_Rollout(Rollout_Policy):
+    '''Plays at most max_moves moves (randomly, or as Heavy_Rollout if heavy), and if the game is
+    still not over, returns evaluator's estimate of the result instead of playing on.
+
+    Arguments:
+        max_moves:
+            int - number of moves to play before evaluating.
+        evaluator:
+            function - called as evaluator(game) on a game that is not over, returns tuple of
+            estimated rewards for players (0, 1), each in the range -1 to 1. Defaults to
+            threat_evaluator, which needs a Connect_Four_Bitboard.
+        heavy:
+            boolean - whether to play the moves as Heavy_Rollout does. Only for
+            Connect_Four_Bitboard.
+    '''
+    def __init__(self, max_moves=8, evaluator=None, heavy=False):
+        self.max_moves = max_moves
+        self.evaluator = evaluator or threat_evaluator
+        self.heavy = heavy
+
+    def rollout(self, game):
+        if isinstance(game, Connect_Four_Bitboard):
+            _bitboard_playout(game, self.max_moves, self.heavy)
+        else:
+            if self.heavy:
+                raise Exception('heavy rollouts need a Connect_Four_Bitboard')
+            for _ in range(self.max_moves):
+                if game.game_over:
+                    break
+                game.random_move(game.player_turn)
+        if game.game_over:
+            return game.get_reward()
+        return self.evaluator(game)
+
+def threat_evaluator(game, scale=0.25):
+    '''Cheap static evaluation of a Connect_Four_Bitboard position: the difference between the
+    number of empty cells that would complete 4 in a row for each player (i.e. their threats),
+    squashed into the range -1 to 1. Returns tuple of rewards for players (0, 1).
+    '''
+    if not isinstance(game, Connect_Four_Bitboard):
+        raise Exception('threat_evaluator needs a Connect_Four_Bitboard')
+    filled = game.bitboards[0] | game.bitboards[1]
+    threats = [_winning_cells(bitboard, filled).bit_count() for bitboard in game.bitboards]
+    value = scale * (threats[0] - threats[1])
+    value = max(-1.0, min(1.0, value))
+    return (value, -value)
+
+def _bitboard_playout(game, max_moves=None, heavy=False):
+    '''Plays up to max_moves moves (or to the end if None) of a Connect_Four_Bitboard, at random
+    or (if heavy) winning or blocking where possible. As with Connect_Four_Bitboard.rollout, the
+    moves are made on local copies of the game's state, which is written back at the end.
+    '''
+    if game.game_over:
+        return
+    bitboards = game.bitboards
+    heights = game.column_heights
+    legal_mask = game.legal_mask
+    player = game.player_turn
+    num_plays = game.num_plays
+    last_plays = _FULL_PLAYS if max_moves is None else min(_FULL_PLAYS, num_plays + max_moves)
+    choice = random.choice
+    action = prev_action = None
+    while num_plays < last_plays:
+        prev_action = action
+        bitboard = bitboards[player]
+        won = False
+        if heavy and num_plays >= 5:
+            #(before the 6th move neither player can have 3 pieces to make a threat)
+            filled = bitboards[0] | bitboards[1]
+            playable = _playable_cells(filled)
+            wins = _winning_cells(bitboard, filled) & playable
+            if wins:
+                action = ((wins & -wins).bit_length() - 1) // _HEIGHT
+                won = True
+            else:
+                blocks = _winning_cells(bitboards[1 - player], filled) & playable
+                if blocks:
+                    action = ((blocks & -blocks).bit_length() - 1) // _HEIGHT
+                else:
+                    action = choice(_LEGAL_COLUMNS[legal_mask])
+        else:
+            action = choice(_LEGAL_COLUMNS[legal_mask])
+        height = heights[action]
+        bitboard |= 1 << (action * _HEIGHT + height)
+        bitboards[player] = bitboard
+        heights[action] = height + 1
+        if height == 5:
+            legal_mask &= ~(1 << action)
+        num_plays += 1
+        player = 1 - player
+        #a heavy move only completes 4 in a row if it was found as a winning move
+        if won or (not heavy and num_plays >= 7 and _is_four(bitboard)):
+            game.winner = 1 - player
+            game.game_over = True
+            break
+        if num_plays == _FULL_PLAYS:
+            game.game_over = True
+            break
+    if action is None:
+        return
+    game.last_actions[1 - player] = action
+    if prev_action is not None:
+        game.last_actions[player] = prev_action
+    game.legal_mask = legal_mask
+    game.player_turn = player
+    game.num_plays = num_plays
+    game.position_hash = None
+
+POLICIES = {'random': Random_Rollout, 'heavy': Heavy_Rollout, 'truncated': Truncated_Rollout}
+
+def make_policy(spec):
+    '''Returns a rollout policy from spec, which is the name of one of POLICIES, or a dict with
+    the 'name' and the keyword arguments for its class, e.g. {"name": "truncated", "heavy": true}.
+    None gives None (i.e. the game's own rollout).
+    '''
+    if spec is None or isinstance(spec, Rollout_Policy):
+        return spec
+    if isinstance(spec, str):
+        spec = {'name': spec}
+    kwargs = dict(spec)
+    name = kwargs.pop('name')
+    if name not in POLICIES:
+        raise Exception('unknown rollout policy: {}'.format(name))
+    return POLICIES[name](**kwargs)
@@ -0,0 +1,115 @@
+'''Exact endgame solver for Connect_Four_Bitboard, for use by MCTS-Solver (see the solver and
+endgame_solver arguments of MCTS). Once few enough cells are empty, an alpha-beta search to the
+end of the game is cheaper than the rollouts it replaces, and its result is exact.
+'''
+from connect4 import _BOTTOM_MASK, _HEIGHT, _playable_cells, _winning_cells
+
+#columns in the order they are searched: moves near the centre are more often good
+_COLUMN_ORDER = (3, 2, 4, 1, 5, 0, 6)
+_COLUMN_MASKS = [((1 << 6) - 1) << (col * _HEIGHT) for col in _COLUMN_ORDER]
+
+#bounds stored in the transposition table
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+class Endgame_Solver():
+    '''Solves Connect_Four_Bitboard positions by negamax alpha-beta search over win/draw/loss
+    values, with a transposition table that is kept between calls.
+
+    Arguments:
+        max_empty:
+            int - calling the solver on a position with more empty cells than this returns None
+            rather than solving it.
+        table_size:
+            int - the transposition table is cleared when it holds more positions than this.
+
+    Attributes:
+        max_empty, table_size:
+            as for the arguments of the same name.
+        table:
+            dict mapping position key to (value, bound).
+        nodes:
+            int - number of positions searched, over all calls.
+    '''
+    def __init__(self, max_empty=12, table_size=1000000):
+        self.max_empty = max_empty
+        self.table_size = table_size
+        self.table = {}
+        self.nodes = 0
+
+    def __call__(self, game):
+        '''Returns the value of game for the player to move (1 win, 0 draw, -1 loss) with perfect
+        play, or None if it has more than max_empty empty cells.
+        '''
+        if 42 - game.num_plays > self.max_empty:
+            return None
+        return self.solve(game)
+
+    def solve(self, game):
+        '''Returns the value of game for the player to move (1 win, 0 draw, -1 loss) with perfect
+        play. The game must not be over.
+        '''
+        if len(self.table) > self.table_size:
+            self.table.clear()
+        current = game.bitboards[game.player_turn]
+        filled = game.bitboards[0] | game.bitboards[1]
+        return self.negamax(current, filled, -1, 1)
+
+    def negamax(self, current, filled, alpha, beta):
+        '''Returns the value for the player to move of the position where that player's pieces are
+        current and all pieces are filled, searching only for values between alpha and beta.
+        '''
+        self.nodes += 1
+        playable = _playable_cells(filled)
+        if not playable:
+            return 0
+        if _winning_cells(current, filled) & playable:
+            return 1
+        opponent = current ^ filled
+        opponent_wins = _winning_cells(opponent, filled)
+        forced = opponent_wins & playable
+        if forced:
+            if forced & (forced - 1): #two threats at once cannot both be blocked
+                return -1
+            moves = forced
+        else:
+            moves = playable
+        #never play directly below a cell where the opponent would win
+        moves &= ~(opponent_wins >> 1)
+        if not moves:
+            return -1
+
+        #unique key for the position (see the bit layout in connect4)
+        key = current + filled + _BOTTOM_MASK
+        entry = self.table.get(key)
+        if entry is not None:
+            value, bound = entry
+            if bound == _EXACT:
+                return value
+            if bound == _LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        original_alpha = alpha
+        best = -1
+        for column_mask in _COLUMN_MASKS:
+            move = moves & column_mask
+            if not move:
+                continue
+            value = -self.negamax(opponent, filled | move, -beta, -alpha)
+            if value > best:
+                best = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        if best <= original_alpha:
+            bound = _UPPER
+        elif best >= beta:
+            bound = _LOWER
+        else:
+            bound = _EXACT
+        self.table[key] = (best, bound)
+        return best
@@ -0,0 +1,185 @@
+'''Headless tournament between MCTS configurations, with games spread over a process pool.
+
+Each player is a name and a JSON object of keyword arguments for MCTS, plus optionally 'time'
+(seconds per move, default None) and 'engine' ('nodes' or 'arrays'). Every pair of players meets
+for the given number of games, alternating who moves first and cycling through a fixed set of
+openings. Each game is seeded from its index, so with iteration budgets (rather than time) the
+whole tournament is reproducible. Finished games are appended to the output file as JSON lines as
+they complete, and games already in the file are skipped, so an interrupted run can be resumed.
+Game ids include a hash of both players' settings, so changing a player's settings starts its
+games afresh, and only the games of the current run are summarised.
+
+Usage example:
+    python tournament.py --games 200 --output results.jsonl \\
+        --player 'c2={"max_iterations": 2000}' \\
+        --player 'c1={"max_iterations": 2000, "exploration": 1}'
+'''
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import math
+import os
+
+from match import OPENINGS, play_game
+
+def _play_scheduled_game(game_id, names, settings, seed, opening):
+    '''Worker function: plays one scheduled game and returns its result record.'''
+    winner = play_game(settings, seed, opening)
+    return {'game': game_id, 'first': names[0], 'second': names[1], 'seed': seed,
+            'opening': list(opening), 'winner': None if winner is None else names[winner],
+            'settings': {names[0]: settings[0], names[1]: settings[1]}}
+
+def settings_hash(settings):
+    '''Returns a short hash of a player's settings (dict), the same for equal settings in any
+    key order.
+    '''
+    canonical = json.dumps(settings, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode()).hexdigest()[:12]
+
+def schedule(players, games_per_pair, seed=0):
+    '''Returns list of (game id, (first player name, second player name), seed, opening) for every
+    game in a round robin between players (dict mapping name to settings).
+    '''
+    games = []
+    for pair in itertools.combinations(sorted(players), 2):
+        for i in range(games_per_pair):
+            names = pair if i % 2 == 0 else pair[::-1]
+            #ids and seeds depend only on the pair, their settings and game number, so that a run
+            #can be resumed with more games or players
+            game_id = '{}@{}:{}@{}:{}'.format(pair[0], settings_hash(players[pair[0]]),
+                                              pair[1], settings_hash(players[pair[1]]), i)
+            games.append((game_id, names, seed + i, OPENINGS[(i // 2) % len(OPENINGS)]))
+    return games
+
+def wilson_interval(score, games, z=1.96):
+    '''Returns (low, high) Wilson score interval for a win rate of score (with draws counted as
+    half a win) over games, at the confidence given by z (95% by default).
+    '''
+    if games == 0:
+        return (0.0, 1.0)
+    rate = score / games
+    centre = rate + z * z / (2 * games)
+    spread = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games))
+    scale = 1 + z * z / games
+    return ((centre - spread) / scale, (centre + spread) / scale)
+
+def elo_ratings(results, iterations=1000):
+    '''Fits Elo ratings (Bradley-Terry model, draws as half a win) to the game results, with the
+    mean rating fixed at 0. Each pair of players is given one extra virtual draw, so that ratings
+    stay finite when one player wins every game.
+
+    Arguments:
+        results:
+            list of result records, as returned by _play_scheduled_game.
+
+    Returns dict mapping player name to rating.
+    '''
+    names = sorted({name for result in results for name in (result['first'], result['second'])})
+    wins = {name: 0.0 for name in names}
+    meetings = {}
+    for result in results:
+        pair = tuple(sorted((result['first'], result['second'])))
+        meetings[pair] = meetings.get(pair, 1) + 1
+        if result['winner'] is None:
+            for name in pair:
+                wins[name] += 0.5
+        else:
+            wins[result['winner']] += 1
+    for pair in meetings:
+        for name in pair:
+            wins[name] += 0.5
+    strength = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        #minorisation-maximisation update for the Bradley-Terry model
+        for name in names:
+            denominator = sum(
+                count / (strength[name] + strength[pair[1] if pair[0] == name else pair[0]])
+                for pair, count in meetings.items() if name in pair
+            )
+            if denominator:
+                strength[name] = wins[name] / denominator
+    ratings = {name: 400 * math.log10(strength[name]) for name in names}
+    mean = sum(ratings.values()) / len(ratings) if ratings else 0
+    return {name: rating - mean for name, rating in ratings.items()}
+
+def summarise(results):
+    '''Returns dict mapping each player to its games, wins, draws, losses, score rate with 95%
+    confidence interval, and Elo rating.
+    '''
+    summary = {}
+    for result in results:
+        for name in (result['first'], result['second']):
+            record = summary.setdefault(name, {'games': 0, 'wins': 0, 'draws': 0, 'losses': 0})
+            record['games'] += 1
+            if result['winner'] is None:
+                record['draws'] += 1
+            elif result['winner'] == name:
+                record['wins'] += 1
+            else:
+                record['losses'] += 1
+    ratings = elo_ratings(results)
+    for name, record in summary.items():
+        score = record['wins'] + 0.5 * record['draws']
+        record['score_rate'] = score / record['games']
+        record['score_rate_95'] = wilson_interval(score, record['games'])
+        record['elo'] = ratings[name]
+    return summary
+
+def run_tournament(players, games_per_pair, output, workers=None, seed=0):
+    '''Plays all the games in the tournament that are not already in output, spread over a pool
+    of worker processes, appending each result to output as soon as it finishes.
+
+    Returns list of the result records of the games in this tournament, including those already in
+    output. Other records in output (from other players or settings) are left out.
+    '''
+    games = schedule(players, games_per_pair, seed)
+    game_ids = {game[0] for game in games}
+    results = []
+    if os.path.exists(output):
+        with open(output) as f:
+            results = [json.loads(line) for line in f if line.strip()]
+    results = [result for result in results if result['game'] in game_ids]
+    done = {result['game'] for result in results}
+    pending = [game for game in games if game[0] not in done]
+    with open(output, 'a') as f, \
+            concurrent.futures.ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(_play_scheduled_game, game_id, names,
+                        [players[names[0]], players[names[1]]], game_seed, opening)
+            for game_id, names, game_seed, opening in pending
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+    return results
+
+def parse_player(text):
+    '''Parses a 'name=JSON settings' command line argument into (name, settings).'''
+    name, _, settings = text.partition('=')
+    settings = json.loads(settings) if settings else {}
+    if not any(key in settings for key in ('time', 'max_iterations', 'max_nodes')):
+        settings['max_iterations'] = 1000
+    return name, settings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--player', type=parse_player, action='append', required=True,
+                        help="player as name=JSON settings, e.g. 'c1={\"exploration\": 1}'")
+    parser.add_argument('--games', type=int, default=100, help='games per pair of players')
+    parser.add_argument('--output', default='tournament.jsonl', help='JSON lines results file')
+    parser.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    players = dict(args.player)
+    if len(players) < 2:
+        parser.error('at least two players with different names are needed')
+    results = run_tournament(players, args.games, args.output, args.workers, args.seed)
+    print(json.dumps(summarise(results), indent=2))
+
+if __name__ == '__main__':
+    main()
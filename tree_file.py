@@ -0,0 +1,487 @@
+'''Compact binary files holding an MCTS search tree, for warm starting searches (e.g. after a
+service restarts) and for offline analysis of trees too large to load as Node objects.
+
+A file has a short JSON header, then a node table and an edge table as packed little-endian
+records. Tree_File memory maps the tables, so opening a file reads only the header, and queries
+read only the pages of the nodes they visit. Nodes are numbered in breadth-first order from the
+root (node 0), and the edges of each node (child and action) are stored contiguously. A node
+shared by several parents through the transposition table is stored once, with an edge from
+each parent.
+
+Usage example:
+    save_tree(search, 'tree.bin')
+    tree = Tree_File('tree.bin')
+    print(tree.principal_variation(), tree.top_lines(3), tree.visits_per_depth())
+    search = MCTS(game, 1.0)
+    warm_start(search, tree)
+    move = search.run_MCTS()
+
+Running this module prints the summary, top lines and visits per depth of a saved tree as JSON:
+    python tree_file.py tree.bin --lines 3
+'''
+import argparse
+import gc
+import json
+import struct
+
+import numpy as np
+
+from MCTS import Node
+
+_MAGIC = b'MCTSTREE'
+_VERSION = 1
+_HEADER_SIZE = struct.Struct('<Q')
+_ALIGNMENT = 8
+
+#proven is stored as -1, 0 or 1, with this value for None
+_UNPROVEN = -2
+
+NODE_DTYPE = np.dtype([
+    ('num_sims', '<i8'),
+    ('reward_sum', '<f8'),
+    ('first_edge', '<i8'),
+    ('child_count', '<i4'),
+    ('player_num', 'i1'),
+    ('proven', 'i1'),
+])
+EDGE_DTYPE = np.dtype([
+    ('child', '<i8'),
+    ('action', '<i4'),
+])
+
+def _padding(offset):
+    return -offset % _ALIGNMENT
+
+def _node_tables(root):
+    '''Returns numpy arrays of NODE_DTYPE and EDGE_DTYPE records for the nodes reachable from
+    root (a Node), in breadth-first order.
+    '''
+    index = {id(root): 0}
+    order = [root]
+    edge_child = []
+    edge_action = []
+    first_edge = []
+    i = 0
+    while i < len(order):
+        node = order[i]
+        first_edge.append(len(edge_child))
+        for action, child in zip(node.child_actions, node.children):
+            child_index = index.get(id(child))
+            if child_index is None:
+                child_index = index[id(child)] = len(order)
+                order.append(child)
+            edge_child.append(child_index)
+            edge_action.append(action)
+        i += 1
+    nodes = np.zeros(len(order), dtype=NODE_DTYPE)
+    nodes['num_sims'] = [node.num_sims for node in order]
+    nodes['reward_sum'] = [node.reward_sum for node in order]
+    nodes['first_edge'] = first_edge
+    nodes['child_count'] = [len(node.children) for node in order]
+    nodes['player_num'] = [node.player_num for node in order]
+    nodes['proven'] = [_UNPROVEN if node.proven is None else node.proven for node in order]
+    edges = np.zeros(len(edge_child), dtype=EDGE_DTYPE)
+    edges['child'] = edge_child
+    edges['action'] = edge_action
+    return nodes, edges
+
+def _array_tables(tree):
+    '''As _node_tables, for an array_tree.Array_Tree. Its nodes are already stored with the
+    children of each node contiguous, and every node but the root has one edge, so the tables
+    are built with array operations.
+    '''
+    size = tree.size
+    nodes = np.zeros(size, dtype=NODE_DTYPE)
+    nodes['num_sims'] = tree.num_sims[:size]
+    nodes['reward_sum'] = tree.reward_sum[:size]
+    nodes['child_count'] = tree.child_count[:size]
+    nodes['first_edge'] = np.where(tree.child_count[:size] > 0, tree.first_child[:size] - 1, 0)
+    nodes['player_num'] = tree.player_num[:size]
+    nodes['proven'] = _UNPROVEN
+    edges = np.zeros(size - 1, dtype=EDGE_DTYPE)
+    edges['child'] = np.arange(1, size)
+    edges['action'] = tree.action[1:size]
+    return nodes, edges
+
+def save_tree(search, path, metadata=None):
+    '''Writes the tree of search (an MCTS or array_tree.Array_MCTS) to path. The header records
+    the hash of the root's position (game.get_hash()) and the search's total_sims, so that
+    warm_start can check it is given the same position.
+
+    Arguments:
+        search:
+            MCTS - the search whose tree to save.
+        path:
+            str - file to write.
+        metadata:
+            dict - extra JSON-serialisable information to store in the header.
+
+    Returns the number of nodes written.
+    '''
+    if hasattr(search, 'tree'):
+        nodes, edges = _array_tables(search.tree)
+    else:
+        nodes, edges = _node_tables(search.root)
+    header = {
+        'version': _VERSION,
+        'num_nodes': len(nodes),
+        'num_edges': len(edges),
+        'position_hash': search.game.get_hash(),
+        'player_turn': search.game.player_turn,
+        'total_sims': search.total_sims,
+        'game': type(search.game).__name__,
+        'metadata': metadata or {},
+    }
+    header_bytes = json.dumps(header).encode()
+    offset = len(_MAGIC) + _HEADER_SIZE.size + len(header_bytes)
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(_HEADER_SIZE.pack(len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * _padding(offset))
+        f.write(nodes.tobytes())
+        f.write(b'\0' * _padding(nodes.nbytes))
+        f.write(edges.tobytes())
+    return len(nodes)
+
+class Tree_File():
+    '''A tree written by save_tree, with its node and edge tables memory mapped rather than read.
+
+    Arguments:
+        path:
+            str - file to open.
+
+    Attributes:
+        header:
+            dict - the file's header (see save_tree).
+        nodes:
+            numpy memmap of NODE_DTYPE records - num_sims, reward_sum (for the player given by
+            player_num), first_edge and child_count (the node's edges), and proven (-2 if not
+            proven, see the solver argument of MCTS) of each node. Node 0 is the root.
+        edges:
+            numpy memmap of EDGE_DTYPE records - the child and action of each edge.
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise Exception('{} is not a tree file'.format(path))
+            (header_length,) = _HEADER_SIZE.unpack(f.read(_HEADER_SIZE.size))
+            self.header = json.loads(f.read(header_length))
+        if self.header['version'] != _VERSION:
+            raise Exception('unsupported tree file version: {}'.format(self.header['version']))
+        offset = len(_MAGIC) + _HEADER_SIZE.size + header_length
+        offset += _padding(offset)
+        num_nodes = self.header['num_nodes']
+        num_edges = self.header['num_edges']
+        self.nodes = np.memmap(path, dtype=NODE_DTYPE, mode='r', offset=offset,
+                               shape=(num_nodes,))
+        offset += num_nodes * NODE_DTYPE.itemsize
+        offset += _padding(offset)
+        #numpy cannot map an empty array, e.g. the edges of a tree with only a root
+        self.edges = np.memmap(path, dtype=EDGE_DTYPE, mode='r', offset=offset,
+                               shape=(num_edges,)) if num_edges else np.zeros(0, EDGE_DTYPE)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def children(self, node):
+        '''Returns numpy array of the edge records (child, action) of node.'''
+        first = int(self.nodes['first_edge'][node])
+        return self.edges[first:first + int(self.nodes['child_count'][node])]
+
+    def find(self, actions, node=0):
+        '''Returns the node reached from node by the actions (iterable of ints), or None if the
+        tree does not include it.
+        '''
+        for action in actions:
+            edges = self.children(node)
+            match = np.flatnonzero(edges['action'] == action)
+            if not match.size:
+                return None
+            node = int(edges['child'][match[0]])
+        return node
+
+    def mean_reward(self, node):
+        '''Returns the average reward of node's simulations for the player who chose it, or None
+        if it has none.
+        '''
+        num_sims = int(self.nodes['num_sims'][node])
+        return float(self.nodes['reward_sum'][node]) / num_sims if num_sims else None
+
+    def principal_variation(self, node=0, max_length=None):
+        '''Returns the line of play from node that follows the most visited child at each step,
+        as a list of dicts with the action, num_sims and mean_reward (see 'mean_reward') of each
+        node on it.
+        '''
+        line = []
+        while max_length is None or len(line) < max_length:
+            edges = self.children(node)
+            if not len(edges):
+                break
+            best = int(np.argmax(self.nodes['num_sims'][edges['child']]))
+            node = int(edges['child'][best])
+            line.append({'action': int(edges['action'][best]),
+                         'num_sims': int(self.nodes['num_sims'][node]),
+                         'mean_reward': self.mean_reward(node)})
+        return line
+
+    def top_lines(self, k=3, node=0, max_length=10):
+        '''Returns the principal variations (see 'principal_variation') starting with each of the
+        k most visited children of node, most visited first, as a list of dicts with the actions
+        of the line and the num_sims and mean_reward of its first move.
+        '''
+        edges = self.children(node)
+        num_sims = self.nodes['num_sims'][edges['child']]
+        lines = []
+        for best in np.argsort(-num_sims, kind='stable')[:k]:
+            child = int(edges['child'][best])
+            line = self.principal_variation(child, max_length - 1)
+            lines.append({'actions': [int(edges['action'][best])] + [
+                              step['action'] for step in line],
+                          'num_sims': int(num_sims[best]),
+                          'mean_reward': self.mean_reward(child)})
+        return lines
+
+    def visits_per_depth(self, node=0, max_depth=None):
+        '''Returns list of dicts for each generation below node: its depth, the number of nodes
+        in it and how many of them have been visited, and their total simulations. Generations
+        are found with array operations on whole generations at a time. A node shared through
+        transpositions is counted in every generation it is reached in, but once per generation.
+        '''
+        nodes = self.nodes
+        generation = np.array([node])
+        results = []
+        depth = 0
+        while generation.size and (max_depth is None or depth < max_depth):
+            counts = nodes['child_count'][generation].astype(np.int64)
+            total = counts.sum()
+            if total == 0:
+                break
+            #index of every edge of generation: each node's first edge plus 0, 1, ..., count-1
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            edge_index = np.repeat(nodes['first_edge'][generation], counts) + offsets
+            generation = np.unique(self.edges['child'][edge_index])
+            num_sims = nodes['num_sims'][generation]
+            depth += 1
+            results.append({'depth': depth, 'nodes': int(generation.size),
+                            'visited_nodes': int(np.count_nonzero(num_sims)),
+                            'num_sims': int(num_sims.sum())})
+        return results
+
+    def summary(self):
+        '''Returns dict of the header (without metadata), the number of nodes and edges, and the
+        root's principal variation.
+        '''
+        header = {key: value for key, value in self.header.items() if key != 'metadata'}
+        return dict(header, principal_variation=self.principal_variation(max_length=10))
+
+    def close(self):
+        '''Drops the tables. The file is unmapped once no arrays taken from them are left.'''
+        self.nodes = None
+        self.edges = None
+
+def _subtree_order(tree_file, start, max_nodes):
+    '''Returns tuple of the file nodes below start in breadth-first order (start first), and for
+    each of them the list of (position in that order of the child, action) of its edges. A node
+    gets its edges only if all of its children fit within max_nodes (None for no limit), except
+    start, which always does.
+    '''
+    #the columns are read whole, as the Node objects built from them take far more memory
+    first_edge = tree_file.nodes['first_edge'].tolist()
+    child_count = tree_file.nodes['child_count'].tolist()
+    edge_child = tree_file.edges['child'].tolist()
+    edge_action = tree_file.edges['action'].tolist()
+    order = [start]
+    position = {start: 0}
+    edges = []
+    i = 0
+    while i < len(order):
+        node = order[i]
+        count = child_count[node]
+        node_edges = []
+        if count and (i == 0 or max_nodes is None or len(order) + count <= max_nodes):
+            first = first_edge[node]
+            for child, action in zip(edge_child[first:first + count],
+                                     edge_action[first:first + count]):
+                child_position = position.get(child)
+                if child_position is None:
+                    child_position = position[child] = len(order)
+                    order.append(child)
+                node_edges.append((child_position, action))
+        edges.append(node_edges)
+        i += 1
+    return order, edges
+
+def warm_start(search, tree_file, actions=(), max_nodes=None):
+    '''Replaces the tree of search (a new MCTS or array_tree.Array_MCTS) with the saved tree in
+    tree_file, so that its statistics are kept. The saved root must be search's position, or
+    lead to it through actions (as with MCTS.advance).
+
+    Nodes shared through transpositions stay shared, but are not put in the transposition table,
+    so new transpositions to them are not found. Network priors are not saved, so with an
+    evaluator only the root's are recomputed. A tree saved with lazy_expansion may lack children
+    for some actions: the loaded tree is replayed on the game to find them, and they become the
+    node's untried actions with lazy_expansion, or are added as new children without it (an
+    Array_MCTS cannot load such a tree).
+
+    Arguments:
+        search:
+            MCTS - the search to warm start, created for the position to search.
+        tree_file:
+            Tree_File or str - the saved tree, or the path of its file.
+        actions:
+            iterable of ints - actions played from the saved root to reach search's position.
+        max_nodes:
+            int - maximum number of nodes to load, or None for all. Nodes are loaded breadth
+            first, nearest the root.
+
+    Returns the number of nodes loaded, or 0 if the position is not in the saved tree.
+    '''
+    if not isinstance(tree_file, Tree_File):
+        tree_file = Tree_File(tree_file)
+    actions = list(actions)
+    if not actions and tree_file.header['position_hash'] != search.game.get_hash():
+        raise Exception('the saved tree is for a different position')
+    start = tree_file.find(actions)
+    if start is None:
+        return 0
+    #the cyclic garbage collector would otherwise run over the growing tree again and again while
+    #it is built, more than doubling the time taken
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _warm_start(search, tree_file, start, max_nodes)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def _warm_start(search, tree_file, start, max_nodes):
+    '''warm_start from node start of tree_file, once it has been found.'''
+    order, edges = _subtree_order(tree_file, start, max_nodes)
+    records = tree_file.nodes[np.array(order)]
+    num_sims = records['num_sims'].tolist()
+    reward_sum = records['reward_sum'].tolist()
+    player_num = records['player_num'].tolist()
+    proven = records['proven'].tolist()
+
+    if hasattr(search, 'tree'):
+        def visit(position, sim_game, missing):
+            if missing:
+                raise Exception('Array_MCTS cannot load a tree with missing children (saved '
+                                'with lazy expansion)')
+        _replay(search, edges, visit)
+        _load_array_tree(search, order, edges, num_sims, reward_sum, player_num)
+    else:
+        nodes = []
+        for i in range(len(order)):
+            node = Node(None, player_num[i])
+            node.num_sims = num_sims[i]
+            node.reward_sum = reward_sum[i]
+            node.proven = None if proven[i] == _UNPROVEN else proven[i]
+            nodes.append(node)
+        for node, node_edges in zip(nodes, edges):
+            for child_position, action in node_edges:
+                child = nodes[child_position]
+                if child.parent is None and child_position != 0:
+                    child.parent = node
+                    child.depth = node.depth + 1
+                    child.action = action
+                node.add_child(child, action)
+        root = nodes[0]
+        search.root = root
+        search.num_nodes = len(nodes)
+        if search.transposition_table is not None:
+            search.transposition_table.clear() #its nodes are those of the replaced tree
+        def visit(position, sim_game, missing):
+            #the root's children are all created up front, see the lazy_expansion argument of MCTS
+            if search.lazy_expansion and position != 0:
+                nodes[position].untried = missing
+            elif missing:
+                search.expand(nodes[position], missing, sim_game)
+        _replay(search, edges, visit)
+        if not root.children:
+            search.sim_game.restore(search.root_snapshot)
+            search.expand(root, search.sim_game.legal_actions(), search.sim_game)
+        root.untried = []
+        if search.evaluator is not None:
+            search.evaluate_root()
+    search.total_sims = num_sims[0]
+    return len(order)
+
+def _replay(search, edges, visit):
+    '''Plays through the loaded tree on search.sim_game, from its root, calling
+    visit(position, sim_game, missing) at each loaded node that has children, with sim_game in
+    the node's position and missing the list of legal actions it has no child for. Each node is
+    visited once, even if it is reached through several transpositions.
+    '''
+    sim_game = search.sim_game
+    sim_game.restore(search.root_snapshot)
+
+    def missing_actions(position):
+        child_actions = {action for _, action in edges[position]}
+        return [action for action in sim_game.legal_actions() if action not in child_actions]
+
+    if not edges[0]:
+        return
+    seen = {0}
+    visit(0, sim_game, missing_actions(0))
+    stack = [(None, iter(edges[0]))] #(action played to reach the node, iterator over its edges)
+    while stack:
+        for child, action in stack[-1][1]:
+            if child not in seen and edges[child]:
+                seen.add(child)
+                sim_game.play(action)
+                visit(child, sim_game, missing_actions(child))
+                stack.append((action, iter(edges[child])))
+                break
+        else:
+            action, _ = stack.pop()
+            if action is not None:
+                sim_game.undo(action)
+
+def _load_array_tree(search, order, edges, num_sims, reward_sum, player_num):
+    '''warm_start for an array_tree.Array_MCTS: fills a new Array_Tree, whose breadth-first
+    layout matches the order nodes were loaded in.
+    '''
+    from array_tree import Array_Tree
+    tree = Array_Tree(max(len(order), 1024))
+    tree.size = len(order)
+    tree.num_sims[:tree.size] = num_sims
+    tree.reward_sum[:tree.size] = reward_sum
+    tree.player_num[:tree.size] = player_num
+    tree.action[0] = -1
+    tree.parent[0] = -1
+    for node, node_edges in enumerate(edges):
+        if not node_edges:
+            continue
+        positions = [child_position for child_position, _ in node_edges]
+        if positions != list(range(positions[0], positions[0] + len(positions))):
+            raise Exception('Array_MCTS cannot load a tree with transpositions')
+        children = slice(positions[0], positions[0] + len(positions))
+        tree.first_child[node] = positions[0]
+        tree.child_count[node] = len(positions)
+        tree.action[children] = [action for _, action in node_edges]
+        tree.parent[children] = node
+        tree.depth[children] = tree.depth[node] + 1
+    search.tree = tree
+    search.root = 0
+    if tree.child_count[0] == 0:
+        search.sim_game.restore(search.root_snapshot)
+        tree.expand(0, search.sim_game.legal_actions(), search.sim_game.player_turn)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='tree file written by save_tree')
+    parser.add_argument('--lines', type=int, default=3, help='number of top lines to show')
+    parser.add_argument('--length', type=int, default=10, help='maximum moves per line')
+    parser.add_argument('--max-depth', type=int, help='deepest generation to count visits for')
+    args = parser.parse_args()
+    tree = Tree_File(args.path)
+    print(json.dumps({
+        'summary': tree.summary(),
+        'top_lines': tree.top_lines(args.lines, max_length=args.length),
+        'visits_per_depth': tree.visits_per_depth(max_depth=args.max_depth),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()